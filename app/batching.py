@@ -0,0 +1,116 @@
+import time
+from collections import defaultdict
+
+from app.config import VALIDATION_BATCH_SIZE, VALIDATION_BATCH_WAIT_MS
+from app.utilities.autoscaling import scaling_signal
+from app.utilities.logging import logger
+from app.utilities.tracing import tracer
+
+
+class ValidationBatcher:
+    """
+    Collects messages into per-worker batches across the queues of a round.
+
+    A worker's batch is sent when it has `batch_size` emails, or when its oldest email
+    has waited `max_wait` seconds. The result of each email is stored with
+    EmailProcessor.store_result(), which calls `on_complete` with the delivery tagged
+    message to acknowledge or reject it.
+
+    The trace of a message covers it until it is queued for a batch. The batch then has
+    a trace of its own, with the job uids and queue names of its messages, in order.
+    """
+
+    def __init__(
+        self,
+        email_processor,
+        on_complete,
+        batch_size=VALIDATION_BATCH_SIZE,
+        max_wait=VALIDATION_BATCH_WAIT_MS / 1000,
+    ):
+        self.email_processor = email_processor
+        self.on_complete = on_complete
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+
+        # Pending (message, job_uid, enqueued_at) tuples by worker
+        self.pending = defaultdict(list)
+
+    def add(self, message, job_uid):
+        """
+        Queue a message for its worker, sending the batches that are due.
+
+        Ends the trace of the message started by the caller.
+        """
+        try:
+            if not self.email_processor.check_message(message):
+                self.on_complete(message, job_uid, False)
+                return
+
+            # Emails resolved locally don't wait for a batch
+            result = self.email_processor.prevalidate(message.get("email"))
+            if result:
+                self.email_processor.store_result(
+                    message, job_uid, result, self.on_complete
+                )
+                return
+        finally:
+            tracer.end_trace()
+
+        worker = self.email_processor.get_worker(message.get("email"))
+        self.pending[worker].append((message, job_uid, time.time()))
+        if len(self.pending[worker]) >= self.batch_size:
+            self.flush_worker(worker)
+        self.flush_expired()
+
+    def flush_expired(self):
+        """Send the batches whose oldest email waited longer than `max_wait`."""
+        now = time.time()
+        for worker in list(self.pending):
+            if now - self.pending[worker][0][2] >= self.max_wait:
+                self.flush_worker(worker)
+
+    def flush(self):
+        """Send all pending batches."""
+        for worker in list(self.pending):
+            self.flush_worker(worker)
+
+    def flush_worker(self, worker):
+        batch = self.pending.pop(worker, [])
+        if not batch:
+            return
+
+        start_time = time.time()
+        wait = start_time - batch[0][2]
+        tracer.start_trace(
+            worker=worker,
+            batch_size=len(batch),
+            job_uids=[job_uid for _, job_uid, _ in batch],
+            queues=[message.get("queueName") for message, _, _ in batch],
+        )
+
+        emails = [message.get("email") for message, _, _ in batch]
+        try:
+            results = self.email_processor.validate_batch(worker, emails)
+        except Exception as e:
+            logger.error(
+                f"Error validating a batch of {len(batch)} emails at {worker}: {e}"
+            )
+            results = [None] * len(batch)
+
+        for (message, job_uid, _), result in zip(batch, results):
+            if result is None:
+                self.on_complete(message, job_uid, False)
+                continue
+            self.email_processor.store_result(
+                message, job_uid, result, self.on_complete
+            )
+
+        elapsed = time.time() - start_time
+        tracer.end_trace()
+        scaling_signal.record_batch(len(batch), wait)
+        for _ in batch:
+            scaling_signal.record_processed(elapsed / len(batch))
+
+        logger.debug(
+            f"Validated a batch of {len(batch)} emails at {worker} in {elapsed:.3f} seconds, after waiting {wait * 1000:.1f} ms for it to fill up."
+        )
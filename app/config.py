@@ -56,3 +56,79 @@ if not VALIDATOR_API_KEY:
 
 # Task slot to identify the instance logs are coming from during parallel execution (default is '0' for single instance)
 HOSTNAME = config("HOSTNAME", default="0")
+
+# Autoscaling signal endpoint (set the port to 0 to disable it)
+AUTOSCALING_PORT = config("AUTOSCALING_PORT", cast=int, default=0)
+# Target time (in seconds) to complete the current backlog, used for replica/worker recommendations
+AUTOSCALING_TARGET_SECONDS = config(
+    "AUTOSCALING_TARGET_SECONDS", cast=int, default=3600
+)
+# Smoothing factor of the exponentially weighted moving averages (0 < alpha <= 1)
+AUTOSCALING_SMOOTHING = config("AUTOSCALING_SMOOTHING", cast=float, default=0.3)
+
+# Interval (in seconds) to flush the job progress counters to the database (set to 0 to disable)
+PROGRESS_FLUSH_INTERVAL = config("PROGRESS_FLUSH_INTERVAL", cast=int, default=0)
+
+# Backoff (in seconds) of the background reconnection to RabbitMQ, doubled after each failed attempt
+RABBITMQ_RECONNECT_BASE_DELAY = config(
+    "RABBITMQ_RECONNECT_BASE_DELAY", cast=float, default=1
+)
+RABBITMQ_RECONNECT_MAX_DELAY = config(
+    "RABBITMQ_RECONNECT_MAX_DELAY", cast=float, default=60
+)
+
+# Per-message tracing, exported to TRACE_FILE in the Chrome trace event format (set the rate to 0 to disable)
+TRACE_SAMPLE_RATE = config("TRACE_SAMPLE_RATE", cast=float, default=0)
+TRACE_FILE = config("TRACE_FILE", default="trace.json")
+
+# Sampling profiler, triggered with SIGUSR1 or at start up, writes folded stacks for flame graphs
+PROFILE_AT_START = config("PROFILE_AT_START", cast=bool, default=False)
+PROFILE_SECONDS = config("PROFILE_SECONDS", cast=int, default=30)
+PROFILE_INTERVAL = config("PROFILE_INTERVAL", cast=float, default=0.01)
+PROFILE_DIR = config("PROFILE_DIR", default=".")
+
+# Capture of the message stream and worker responses for replays (gzipped JSON lines, empty to disable)
+CAPTURE_FILE = config("CAPTURE_FILE", default="")
+# Seconds between writes of the buffered capture events, at most this much is lost on a kill
+CAPTURE_FLUSH_SECONDS = config("CAPTURE_FLUSH_SECONDS", cast=float, default=5)
+
+# Batched validation: up to VALIDATION_BATCH_SIZE emails per worker request (1 disables batching),
+# waiting at most VALIDATION_BATCH_WAIT_MS for a batch to fill up
+VALIDATION_BATCH_SIZE = config("VALIDATION_BATCH_SIZE", cast=int, default=1)
+VALIDATION_BATCH_WAIT_MS = config("VALIDATION_BATCH_WAIT_MS", cast=int, default=50)
+
+# Routing of the emails to the workers: "round_robin", or "affinity" to keep the emails of a domain on the same worker
+WORKER_ROUTING = config("WORKER_ROUTING", default="round_robin")
+# With affinity routing, a worker takes at most this factor times the average load before the domain spills over
+WORKER_AFFINITY_LOAD_FACTOR = config(
+    "WORKER_AFFINITY_LOAD_FACTOR", cast=float, default=1.25
+)
+# Number of recent assignments the worker loads are measured over
+WORKER_AFFINITY_WINDOW = config("WORKER_AFFINITY_WINDOW", cast=int, default=1000)
+
+# Where the validation results go: "broker" publishes each result to the results queue,
+# "s3" writes them to S3 as gzipped JSON lines and publishes only progress and completion markers
+RESULTS_SINK = config("RESULTS_SINK", default="broker")
+RESULTS_S3_PREFIX = config("RESULTS_S3_PREFIX", default="results/")
+# Results are uploaded in chunk objects of at most RESULTS_CHUNK_ROWS rows or RESULTS_CHUNK_SECONDS,
+# which bound how many messages wait unacknowledged for their upload, and for how long
+RESULTS_CHUNK_ROWS = config("RESULTS_CHUNK_ROWS", cast=int, default=10000)
+RESULTS_CHUNK_SECONDS = config("RESULTS_CHUNK_SECONDS", cast=float, default=30)
+# Seconds without new results after which the results of a job are completed
+RESULTS_IDLE_SECONDS = config("RESULTS_IDLE_SECONDS", cast=int, default=60)
+
+# Local pre-validation of syntax, disposable and blocked domains and role accounts before the workers
+PREVALIDATION = config("PREVALIDATION", cast=bool, default=False)
+PREVALIDATION_DISPOSABLE_FILE = config(
+    "PREVALIDATION_DISPOSABLE_FILE",
+    default=os.path.join(os.path.dirname(__file__), "data", "disposable_domains.txt"),
+)
+PREVALIDATION_BLOCKED_FILE = config("PREVALIDATION_BLOCKED_FILE", default="")
+PREVALIDATION_ROLE_FILE = config(
+    "PREVALIDATION_ROLE_FILE",
+    default=os.path.join(os.path.dirname(__file__), "data", "role_prefixes.txt"),
+)
+# Interval (in seconds) to check the lists for changes and reload them
+PREVALIDATION_RELOAD_SECONDS = config(
+    "PREVALIDATION_RELOAD_SECONDS", cast=int, default=60
+)
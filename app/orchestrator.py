@@ -0,0 +1,122 @@
+import json
+import time
+
+from app.batching import ValidationBatcher
+from app.config import ROWS_PER_ROUND, VALIDATION_BATCH_SIZE
+from app.utilities.autoscaling import scaling_signal
+from app.utilities.capture import recorder
+from app.utilities.logging import logger
+from app.utilities.tracing import tracer
+
+
+def complete_message(queue_agent, message, job_uid, succeeded, progress_writer=None):
+    """Acknowledge a processed message, or requeue it if processing failed."""
+    if succeeded:
+        with tracer.span("acknowledge_message"):
+            acknowledged = queue_agent.acknowledge_message(message)
+        if acknowledged and progress_writer:
+            progress_writer.record(job_uid)
+    else:
+        with tracer.span("reject_message"):
+            queue_agent.reject_message(message, requeue=True)
+
+
+def process_round(
+    queue_agent, email_processor, discovered_queues, progress_writer=None
+):
+    """
+    Process a round of messages, `ROWS_PER_ROUND` from each of the discovered queues.
+
+    Args:
+        queue_agent: Agent of the vhost with the validation queues.
+        email_processor: Processor validating the emails and publishing the results.
+        discovered_queues: Names of the validation queues to process.
+        progress_writer: Optional JobProgressWriter to count the processed rows.
+
+    With `VALIDATION_BATCH_SIZE` above 1, the emails of the round are sent to the workers
+    in batches, and the pending batches are sent at the end of the round.
+
+    Queues found empty are deleted at the end of the round, once the results of their
+    messages are stored and no messages are left unacknowledged in them.
+    """
+
+    def on_complete(message, job_uid, succeeded):
+        complete_message(queue_agent, message, job_uid, succeeded, progress_writer)
+
+    batcher = None
+    if VALIDATION_BATCH_SIZE > 1:
+        batcher = ValidationBatcher(email_processor, on_complete=on_complete)
+    emptied_queues = []
+
+    # Iterate through each discovered queue
+    for i, queue in enumerate(discovered_queues):
+        # Iterate as many times as the message-per-round setting
+        for _ in range(ROWS_PER_ROUND):
+            logger.debug(
+                f"Attempting to read {ROWS_PER_ROUND} messages from queue: {queue}"
+            )
+            tracer.start_trace(queue=queue)
+            with tracer.span("get_message"):
+                message = queue_agent.get_message(queue_name=queue)
+            if message:
+                message_start_time = time.time()
+                recorder.record_message(queue, message)
+
+                # Get the job uid from queue args,
+                # to be passed to QueueAgent.process_message method
+                # so that it is added to the results queue as an arg
+                with tracer.span("get_job_uid"):
+                    job_uid = queue_agent.get_job_uid(queue_name=queue)
+                tracer.annotate(job_uid=job_uid)
+
+                if batcher:
+                    # Acknowledged or rejected when its batch is validated,
+                    # the batcher ends the trace of the message
+                    batcher.add(message, job_uid)
+                    logger.debug(
+                        f"Row {message['rowNumber']}/{message['totalRows']} from queue {queue} added to a validation batch."
+                    )
+                    continue
+
+                # Acknowledged once the processor completes validation and storing the result
+                email_processor.process_message(message, job_uid, on_complete)
+
+                scaling_signal.record_processed(time.time() - message_start_time)
+                tracer.end_trace()
+
+                logger.debug(
+                    f"Row {message['rowNumber']}/{message['totalRows']} processed from queue {queue}: {json.dumps(message, indent=2)}"
+                )
+            elif not queue_agent.is_connected():
+                # The broker is unreachable, not an empty queue, move on without deleting it
+                logger.debug(
+                    f"Skipping queue {queue} while the connection to RabbitMQ is down."
+                )
+                break
+            else:
+                # No messages in the queue, delete it at the end of the round
+                emptied_queues.append(queue)
+                break
+
+            if i == len(discovered_queues) - 1:
+                logger.debug(
+                    f"Round of processing {ROWS_PER_ROUND} messages from all queues is complete."
+                )
+
+    # Don't hold unacknowledged messages past the end of the round
+    if batcher:
+        batcher.flush()
+
+    for queue in emptied_queues:
+        # Store the results buffered for the queue before acknowledging its last messages
+        if not email_processor.finish_results(queue):
+            continue
+        # Deleting a queue drops its unacknowledged messages, which other replicas may hold
+        message_count = queue_agent.get_message_count(queue, message_type="total")
+        if message_count is None or message_count > 0:
+            continue
+        queue_agent.delete_queue(queue)
+        logger.debug(
+            f"Deleting validation queue {queue} because there is no message in it."
+        )
+    email_processor.finish_idle_results()
@@ -0,0 +1,138 @@
+import os
+import re
+import time
+
+from app.config import (
+    PREVALIDATION_BLOCKED_FILE,
+    PREVALIDATION_DISPOSABLE_FILE,
+    PREVALIDATION_RELOAD_SECONDS,
+    PREVALIDATION_ROLE_FILE,
+)
+from app.utilities.logging import logger
+
+# ASCII dot-atom local part of the RFC 5322 addr-spec. Quoted and internationalized
+# (RFC 6531) local parts are valid too, but left to the workers.
+LOCAL_PART_PATTERN = re.compile(
+    r"[A-Za-z0-9!#$%&'*+/=?^_`{|}~-]+(?:\.[A-Za-z0-9!#$%&'*+/=?^_`{|}~-]+)*"
+)
+# Domain of alphanumeric labels, with an alphabetic or IDNA (xn--) top-level domain.
+# Internationalized domains are matched in their IDNA form.
+DOMAIN_PATTERN = re.compile(
+    r"(?:[A-Za-z0-9](?:[A-Za-z0-9-]{0,61}[A-Za-z0-9])?\.)+"
+    r"(?:[A-Za-z]{2,63}|xn--[A-Za-z0-9-]{1,59})"
+)
+
+
+class _ListFile:
+    """A set of lines from a file, reloaded when the file changes."""
+
+    def __init__(self, path):
+        self.path = path
+        self.mtime = None
+        self.entries = frozenset()
+
+    def reload(self):
+        if not self.path:
+            return
+        try:
+            mtime = os.path.getmtime(self.path)
+            if mtime == self.mtime:
+                return
+            with open(self.path) as list_file:
+                self.entries = frozenset(
+                    line.strip().lower()
+                    for line in list_file
+                    if line.strip() and not line.startswith("#")
+                )
+            self.mtime = mtime
+            logger.info(f"Loaded {len(self.entries)} entries from {self.path}.")
+        except OSError as e:
+            logger.error(f"Error loading {self.path}: {e}")
+
+
+class PreValidator:
+    """
+    Resolves the emails that don't need a worker round trip.
+
+    Malformed emails, disposable and blocked domains and role accounts get a definitive
+    result right away, in the same schema as the worker results. The lists are kept in
+    memory as hash sets, and reloaded when their files change.
+    """
+
+    def __init__(
+        self,
+        disposable_file=PREVALIDATION_DISPOSABLE_FILE,
+        blocked_file=PREVALIDATION_BLOCKED_FILE,
+        role_file=PREVALIDATION_ROLE_FILE,
+        reload_seconds=PREVALIDATION_RELOAD_SECONDS,
+    ):
+        self.disposable = _ListFile(disposable_file)
+        self.blocked = _ListFile(blocked_file)
+        self.roles = _ListFile(role_file)
+        self.reload_seconds = reload_seconds
+        self.last_reload = 0
+
+    def reload(self, force=False):
+        """Reload the lists whose files changed, at most every `reload_seconds`."""
+        now = time.time()
+        if not force and now - self.last_reload < self.reload_seconds:
+            return
+        self.last_reload = now
+        for list_file in (self.disposable, self.blocked, self.roles):
+            list_file.reload()
+
+    @staticmethod
+    def _matches(domain, domains):
+        """Whether the domain or one of its parent domains is in the set."""
+        labels = domain.split(".")
+        return any(".".join(labels[i:]) in domains for i in range(len(labels) - 1))
+
+    def check(self, email):
+        """
+        Return a definitive result for the email, or None if it needs a worker.
+        """
+        self.reload()
+
+        result = self._classify(email)
+        if result is None:
+            return None
+
+        status, reason = result
+        return {"email": email, "status": status, "reason": reason}
+
+    def _classify(self, email):
+        # Only the emails that are certainly malformed are resolved, anything that might
+        # be valid is left to the workers
+        if not email or len(email) > 254 or "@" not in email:
+            return "invalid", "invalid_syntax"
+        if email != email.strip():
+            # Surrounding whitespace may be stripped by the workers
+            return None
+
+        local_part, domain = email.rsplit("@", 1)
+        if not local_part or not domain:
+            return "invalid", "invalid_syntax"
+        if domain.startswith("["):
+            # Address literal, like user@[192.0.2.1]
+            return None
+        if not domain.isascii():
+            try:
+                domain = domain.encode("idna").decode("ascii")
+            except UnicodeError:
+                return None
+
+        if not DOMAIN_PATTERN.fullmatch(domain):
+            return "invalid", "invalid_syntax"
+        if local_part.isascii() and not local_part.startswith('"'):
+            if len(local_part) > 64 or not LOCAL_PART_PATTERN.fullmatch(local_part):
+                return "invalid", "invalid_syntax"
+
+        local_part, domain = local_part.lower(), domain.lower()
+        if self._matches(domain, self.blocked.entries):
+            return "invalid", "blocked_domain"
+        if self._matches(domain, self.disposable.entries):
+            return "disposable", "disposable_domain"
+        # Sub-addressing like noreply+tag@ is the same role account
+        if local_part.split("+", 1)[0] in self.roles.entries:
+            return "role", "role_account"
+        return None
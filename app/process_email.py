@@ -1,20 +1,56 @@
+import time
+
 import requests
 
-from app.config import RABBITMQ_DEFAULT_VHOSTS, VALIDATION_WORKERS, VALIDATOR_API_KEY
+from app.config import (
+    RABBITMQ_DEFAULT_VHOSTS,
+    VALIDATION_WORKERS,
+    VALIDATOR_API_KEY,
+    WORKER_ROUTING,
+    RESULTS_SINK,
+    PREVALIDATION,
+)
+from app.prevalidation import PreValidator
+from app.results_sink import S3ResultsSink
+from app.routing import AffinityRouter
+from app.utilities.autoscaling import scaling_signal
+from app.utilities.capture import recorder
 from app.utilities.logging import logger
 from app.utilities.rabbitmq import QueueAgent
+from app.utilities.tracing import tracer
 
 
 class EmailProcessor:
-    def __init__(self):
+    def __init__(
+        self,
+        queue_agent=None,
+        workers=VALIDATION_WORKERS,
+        routing=WORKER_ROUTING,
+        results_sink=RESULTS_SINK,
+        prevalidation=PREVALIDATION,
+    ):
         self.next_worker = 0
+        self.workers = workers
+        self.router = AffinityRouter(workers) if routing == "affinity" else None
+        # Workers that responded to a batch request as not supporting it
+        self.single_workers = set()
         # Processor will use the second vhost for RabbitMQ
-        self.queue_agent = QueueAgent(rabbitmq_vhost=RABBITMQ_DEFAULT_VHOSTS[1])
+        self.queue_agent = queue_agent or QueueAgent(
+            rabbitmq_vhost=RABBITMQ_DEFAULT_VHOSTS[1]
+        )
 
         if not self.queue_agent:
             logger.error("Queue agent is not initialized.")
             raise Exception("Not connected to RabbitMQ.")
 
+        # Results go to S3, with only markers published to the results queue
+        self.results_sink = None
+        if results_sink == "s3":
+            self.results_sink = S3ResultsSink(publish=self.publish_result)
+
+        # Emails resolved locally skip the worker round trip
+        self.prevalidator = PreValidator() if prevalidation else None
+
     def get_next_worker(self):
         """
         Get the next validation worker in a round-robin fashion.
@@ -22,74 +58,224 @@ class EmailProcessor:
         Validation workers are defined in the VALIDATION_WORKERS
         environment variable as a comma separated list.
         """
-        self.next_worker = (self.next_worker + 1) % len(VALIDATION_WORKERS)
-        worker = VALIDATION_WORKERS[self.next_worker]
+        self.next_worker = (self.next_worker + 1) % len(self.workers)
+        worker = self.workers[self.next_worker]
         return worker
 
-    def validate_email(self, email):
+    def get_worker(self, email):
         """
-        Send the email to the next validation worker and return the response.
+        Get the validation worker for an email.
+
+        With the WORKER_ROUTING environment variable set to "affinity", the emails of a domain
+        are routed to the same worker, otherwise the workers are used in a round-robin fashion.
         """
-        # Grab email and queueName from the message
-        worker = self.get_next_worker()
-        response = requests.post(
-            f"{worker}/validate",
-            json={"email": email, "api_key": VALIDATOR_API_KEY},
-        )
-        return response.json()
+        if self.router:
+            return self.router.route(email)
+        return self.get_next_worker()
 
-    def process_message(self, message, job_uid):
-        """Grab the email from the message, validate it,
-        and publish the result to the appropriate queue.
+    def validate_email(self, email, worker=None):
+        """
+        Send the email to a validation worker and return the response.
 
         Args:
-            message (dict): Incoming message from RabbitMQ queue for emails pending validation.
+            email: The email to validate.
+            worker: The worker to send it to, defaults to the worker picked by get_worker().
+        """
+        worker = worker or self.get_worker(email)
+        start_time = time.time()
+        with tracer.span("validate_email", worker=worker):
+            response = requests.post(
+                f"{worker}/validate",
+                json={"email": email, "api_key": VALIDATOR_API_KEY},
+            )
+        elapsed = time.time() - start_time
+        scaling_signal.record_worker_latency(elapsed)
+        result = response.json()
+        recorder.record_validation(worker, email, elapsed, response.status_code, result)
+        return result
 
-        Returns:
-            True: If processing and publishing was successful.
-            False: If there was an error during processing or publishing.
+    def validate_batch(self, worker, emails):
         """
-        # Grab email and queueName from the message
-        email = message.get("email")
-        queue_name = message.get("queueName")
-        if not email:
-            logger.error(f"No email found in message: {message}")
-            return False
-        if not queue_name:
-            logger.error(f"No queueName found in message: {message}")
-            return False
+        Send a batch of emails to a validation worker in one request.
 
-        try:
-            # Validate the email and get the result
-            validation_result = self.validate_email(email)
-
-            # Ensure the queue exists before publishing
-            if queue_name not in self.queue_agent.list_all_queues():
-                arguments = {
-                    # Total rows in the original CSV, sent in the msg body
-                    "row_count": message.get("totalRows", 0),
-                    # Passing job_uid to the results queue
-                    "jobuid": job_uid,
-                }
-                self.queue_agent.create_queue(
-                    queue_name,
-                    arguments=arguments,
+        Workers that don't support batches are remembered,
+        and sent the emails of their batches one by one.
+
+        Returns:
+            A list with the result of each email, None for the emails that failed.
+        """
+        if worker not in self.single_workers:
+            start_time = time.time()
+            with tracer.span("validate_batch", worker=worker, size=len(emails)):
+                response = requests.post(
+                    f"{worker}/validate/batch",
+                    json={"emails": emails, "api_key": VALIDATOR_API_KEY},
                 )
+
+            if response.status_code in (404, 405, 501):
                 logger.info(
-                    f"Queue {queue_name} did not exist. Created new queue in vhost {RABBITMQ_DEFAULT_VHOSTS[1]} with args {arguments}."
+                    f"Worker {worker} does not support batches, validating its emails one by one."
                 )
+                self.single_workers.add(worker)
+            else:
+                elapsed = time.time() - start_time
+                scaling_signal.record_worker_latency(elapsed)
+                results = response.json().get("results", [])
+                if len(results) != len(emails):
+                    raise ValueError(
+                        f"Worker {worker} returned {len(results)} results for {len(emails)} emails."
+                    )
+                for email, result in zip(emails, results):
+                    recorder.record_validation(
+                        worker,
+                        email,
+                        elapsed / len(emails),
+                        response.status_code,
+                        result,
+                    )
+                return results
 
-            # Publish the validation result to the queue named
-            # the same as the queue of the incoming message
-            self.queue_agent.publish_message(
+        results = []
+        for email in emails:
+            try:
+                results.append(self.validate_email(email, worker=worker))
+            except Exception as e:
+                logger.error(f"Error validating email {email}: {e}")
+                results.append(None)
+        return results
+
+    def publish_result(self, message, job_uid, validation_result):
+        """
+        Publish the validation result of a message to its results queue,
+        creating the queue if it does not exist.
+
+        Returns:
+            True if the result was published, False otherwise.
+        """
+        queue_name = message.get("queueName")
+
+        # Ensure the queue exists before publishing
+        with tracer.span("check_result_queue"):
+            queue_exists = queue_name in self.queue_agent.list_all_queues()
+        if not queue_exists:
+            arguments = {
+                # Total rows in the original CSV, sent in the msg body
+                "row_count": message.get("totalRows", 0),
+                # Passing job_uid to the results queue
+                "jobuid": job_uid,
+            }
+            self.queue_agent.create_queue(
+                queue_name,
+                arguments=arguments,
+            )
+            logger.info(
+                f"Queue {queue_name} did not exist. Created new queue in vhost {RABBITMQ_DEFAULT_VHOSTS[1]} with args {arguments}."
+            )
+
+        # Publish the validation result to the queue named
+        # the same as the queue of the incoming message
+        with tracer.span("publish_message"):
+            published = self.queue_agent.publish_message(
                 queue_name=f"{queue_name}", message_body=validation_result
             )
+        if not published:
+            return False
 
-            logger.info(
-                f"Validation result for {email}: {validation_result} published to queue {queue_name} at vhost {RABBITMQ_DEFAULT_VHOSTS[1]}"
+        logger.info(
+            f"Validation result for {message.get('email')}: {validation_result} published to queue {queue_name} at vhost {RABBITMQ_DEFAULT_VHOSTS[1]}"
+        )
+        return True
+
+    def check_message(self, message):
+        """
+        Whether the message has the email and queueName needed to process it,
+        and its result can be stored.
+        """
+        if not message.get("email"):
+            logger.error(f"No email found in message: {message}")
+            return False
+        if not message.get("queueName"):
+            logger.error(f"No queueName found in message: {message}")
+            return False
+        if self.results_sink and not self.results_sink.accepting(
+            message.get("queueName")
+        ):
+            # Don't validate emails whose results can't be uploaded yet
+            logger.debug(
+                f"Results of queue {message.get('queueName')} are backing off, requeueing."
             )
+            return False
+        return True
 
+    def prevalidate(self, email):
+        """
+        Return the local result of an email that doesn't need a worker, None otherwise.
+        """
+        if not self.prevalidator:
+            return None
+        with tracer.span("prevalidate"):
+            result = self.prevalidator.check(email)
+        if result:
+            logger.debug(f"Resolved {email} locally: {result}")
+        return result
+
+    def store_result(self, message, job_uid, validation_result, on_complete):
+        """
+        Store the validation result of a message, in S3 if the results sink is enabled,
+        otherwise in its results queue.
+
+        `on_complete(message, job_uid, succeeded)` is called once the result is stored,
+        which is deferred until its chunk is uploaded with the S3 results sink.
+        The message is requeued if storing its result fails.
+        """
+        try:
+            if self.results_sink:
+                self.results_sink.add(message, job_uid, validation_result, on_complete)
+                return
+            published = self.publish_result(message, job_uid, validation_result)
+        except Exception as e:
+            logger.error(f"Error storing the result of {message.get('email')}: {e}")
+            on_complete(message, job_uid, False)
+            return
+        on_complete(message, job_uid, published)
+
+    def finish_results(self, queue_name):
+        """
+        Store the results still buffered for an emptied queue.
+
+        Returns:
+            True if no results of the queue are left buffered, False otherwise.
+        """
+        if not self.results_sink:
             return True
+        return self.results_sink.finish(queue_name)
+
+    def finish_idle_results(self):
+        """Store the results that are due, and those of the jobs that are not progressing."""
+        if self.results_sink:
+            self.results_sink.finish_idle()
+
+    def process_message(self, message, job_uid, on_complete):
+        """Grab the email from the message, validate it,
+        and store the result.
+
+        Args:
+            message (dict): Incoming message from RabbitMQ queue for emails pending validation.
+            job_uid: The uid of the job of the message.
+            on_complete: Called as `on_complete(message, job_uid, succeeded)`,
+                with succeeded True if validation and storing the result was successful.
+        """
+        if not self.check_message(message):
+            on_complete(message, job_uid, False)
+            return
+
+        email = message.get("email")
+        try:
+            # Validate the email and get the result, locally if possible
+            validation_result = self.prevalidate(email) or self.validate_email(email)
         except Exception as e:
             logger.error(f"Error processing email {email}: {e}")
-            return False
+            on_complete(message, job_uid, False)
+            return
+
+        self.store_result(message, job_uid, validation_result, on_complete)
@@ -0,0 +1,331 @@
+"""
+Replay a capture of production traffic against a local orchestrator.
+
+The recorded files are published to an in-memory stand-in broker at their recorded arrival
+times, divided by the speed factor, all the rows of a file at once like the file publisher.
+Stand-in worker processes answer the validations with the latency and status recorded for
+the domain of each email.
+
+Usage:
+    python -m app.replay capture.jsonl.gz --speed 4
+"""
+
+import argparse
+import json
+import multiprocessing
+import random
+import socket
+import threading
+import time
+from collections import defaultdict, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from app.orchestrator import process_round
+from app.process_email import EmailProcessor
+from app.utilities.capture import read_capture
+from app.utilities.logging import logger
+
+
+class StandInQueueAgent:
+    """
+    In-memory stand-in for QueueAgent, with the same interface as far as the orchestrator uses it.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.queues = {}
+        self.unacked = {}
+        self.next_delivery_tag = 0
+
+    def is_connected(self):
+        return True
+
+    def list_all_queues_details(self):
+        with self.lock:
+            return [
+                {
+                    "name": name,
+                    "arguments": queue["arguments"],
+                    "messages_ready": len(queue["messages"]),
+                    "messages": len(queue["messages"]) + queue["unacked"],
+                }
+                for name, queue in self.queues.items()
+            ]
+
+    def list_all_queues(self):
+        return [queue["name"] for queue in self.list_all_queues_details()]
+
+    def create_queue(self, queue_name, arguments={}):
+        with self.lock:
+            self.queues.setdefault(
+                queue_name, {"arguments": arguments, "messages": deque(), "unacked": 0}
+            )
+        return True
+
+    def delete_queue(self, queue_name):
+        with self.lock:
+            self.queues.pop(queue_name, None)
+        return True
+
+    def publish_message(self, queue_name, message_body):
+        with self.lock:
+            # Like the default exchange, drop messages to queues that don't exist
+            if queue_name in self.queues:
+                self.queues[queue_name]["messages"].append(json.dumps(message_body))
+        return True
+
+    def get_message(self, queue_name, auto_ack=False):
+        with self.lock:
+            queue = self.queues.get(queue_name)
+            if not queue or not queue["messages"]:
+                return None
+            body = queue["messages"].popleft()
+            self.next_delivery_tag += 1
+            message = json.loads(body)
+            message["delivery_tag"] = self.next_delivery_tag
+            if not auto_ack:
+                queue["unacked"] += 1
+                self.unacked[self.next_delivery_tag] = (queue_name, body)
+            return message
+
+    def acknowledge_message(self, message):
+        with self.lock:
+            entry = self.unacked.pop(message.get("delivery_tag"), None)
+            if entry and entry[0] in self.queues:
+                self.queues[entry[0]]["unacked"] -= 1
+            return entry is not None
+
+    def reject_message(self, message, requeue=True):
+        with self.lock:
+            entry = self.unacked.pop(message.get("delivery_tag"), None)
+            if entry and entry[0] in self.queues:
+                queue = self.queues[entry[0]]
+                queue["unacked"] -= 1
+                if requeue:
+                    queue["messages"].appendleft(entry[1])
+            return entry is not None
+
+    def get_job_uid(self, queue_name):
+        with self.lock:
+            queue = self.queues.get(queue_name)
+            return queue["arguments"].get("jobuid") if queue else None
+
+    def get_message_count(self, queue_name, message_type="ready"):
+        with self.lock:
+            queue = self.queues.get(queue_name)
+            if not queue:
+                return 0
+            if message_type == "unacked":
+                return queue["unacked"]
+            if message_type == "total":
+                return len(queue["messages"]) + queue["unacked"]
+            return len(queue["messages"])
+
+
+def _serve_stand_in_worker(port, profiles, speed):
+    """Serve `/validate` and `/validate/batch` with the recorded responses of the domain of each email."""
+    fallback = [response for responses in profiles.values() for response in responses]
+
+    def respond(email):
+        domain = email.rsplit("@", 1)[-1].lower()
+        ms, status_code, result_status = random.choice(profiles.get(domain) or fallback)
+        return ms, status_code, {"email": email, "status": result_status}
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            if self.path == "/validate/batch":
+                # A batch takes as long as its slowest email
+                responses = [respond(email) for email in body.get("emails", [])]
+                ms = max((response[0] for response in responses), default=0)
+                status_code = 200
+                result = {"results": [response[2] for response in responses]}
+            elif self.path == "/validate":
+                ms, status_code, result = respond(body.get("email", ""))
+            else:
+                self.send_error(404)
+                return
+            time.sleep(ms / 1000 / speed)
+
+            response = json.dumps(result).encode()
+            self.send_response(status_code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(response)))
+            self.end_headers()
+            self.wfile.write(response)
+
+        def log_message(self, format, *args):
+            pass
+
+    ThreadingHTTPServer(("127.0.0.1", port), Handler).serve_forever()
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_stand_in_workers(events, count, speed):
+    """Start stand-in worker processes answering like the recorded workers."""
+    profiles = defaultdict(list)
+    for event in events:
+        if event["e"] == "v":
+            profiles[event["d"]].append((event["ms"], event["s"], event["r"]))
+    if not profiles:
+        raise ValueError("The capture has no recorded worker responses.")
+
+    workers = []
+    processes = []
+    for _ in range(count):
+        port = _free_port()
+        process = multiprocessing.Process(
+            target=_serve_stand_in_worker,
+            args=(port, dict(profiles), speed),
+            daemon=True,
+        )
+        process.start()
+        processes.append(process)
+        workers.append(f"http://127.0.0.1:{port}")
+
+    # Wait for the workers to accept connections
+    for worker in workers:
+        port = int(worker.rsplit(":", 1)[1])
+        while True:
+            try:
+                socket.create_connection(("127.0.0.1", port), timeout=1).close()
+                break
+            except OSError:
+                time.sleep(0.05)
+
+    return workers, processes
+
+
+def plan_arrivals(events):
+    """
+    Return the files to publish as (time, queue name, row count, domains) tuples.
+
+    Files that already existed when the capture started only get their ready messages,
+    the others all their rows. The domains of the rows are the domains of the messages
+    consumed from the queue, sampled when fewer were consumed during the capture.
+    """
+    domains = defaultdict(list)
+    for event in events:
+        if event["e"] == "m":
+            domains[event["q"]].append(event["d"])
+    all_domains = [domain for queue in domains.values() for domain in queue]
+    if not all_domains:
+        all_domains = [event["d"] for event in events if event["e"] == "v"]
+    if not all_domains:
+        raise ValueError("The capture has no recorded emails.")
+
+    arrivals = []
+    for event in events:
+        if event["e"] != "f":
+            continue
+        rows = event["r"] if event.get("x") else event["n"] or event["r"]
+        queue_domains = domains[event["q"]] or all_domains
+        queue_domains = queue_domains[:rows] + random.choices(
+            queue_domains, k=max(rows - len(queue_domains), 0)
+        )
+        arrivals.append((event["t"], event["q"], rows, queue_domains))
+    return arrivals
+
+
+def feed_files(arrivals, queue_agent, speed, done):
+    """Publish the rows of each file to the stand-in broker at its scaled arrival time."""
+    if not arrivals:
+        done.set()
+        return
+
+    start_time = time.time()
+    first_arrival = arrivals[0][0]
+    for arrival_time, queue_name, rows, domains in arrivals:
+        delay = (arrival_time - first_arrival) / speed - (time.time() - start_time)
+        if delay > 0:
+            time.sleep(delay)
+
+        queue_agent.create_queue(
+            queue_name, arguments={"jobuid": queue_name, "row_count": rows}
+        )
+        for row_number, domain in enumerate(domains, start=1):
+            queue_agent.publish_message(
+                queue_name,
+                {
+                    "email": f"user{row_number}@{domain}",
+                    "queueName": queue_name,
+                    "rowNumber": row_number,
+                    "totalRows": rows,
+                },
+            )
+    done.set()
+
+
+def replay(path, speed=1.0, workers=None):
+    """
+    Replay a capture and return the throughput summary.
+
+    Args:
+        path: Path of the capture file.
+        speed: Factor to speed up the arrivals and the worker latencies by.
+        workers: Number of stand-in workers, defaults to the number of recorded workers.
+    """
+    events = read_capture(path)
+    arrivals = plan_arrivals(events)
+    worker_count = workers or len({e["w"] for e in events if e["e"] == "v"}) or 1
+    worker_urls, processes = start_stand_in_workers(events, worker_count, speed)
+
+    validation_agent = StandInQueueAgent()
+    result_agent = StandInQueueAgent()
+    email_processor = EmailProcessor(
+        queue_agent=result_agent, workers=worker_urls, results_sink="broker"
+    )
+
+    done = threading.Event()
+    feeder = threading.Thread(
+        target=feed_files, args=(arrivals, validation_agent, speed, done), daemon=True
+    )
+    start_time = time.time()
+    feeder.start()
+
+    try:
+        while True:
+            discovered_queues = validation_agent.list_all_queues()
+            if not discovered_queues:
+                if done.is_set():
+                    break
+                time.sleep(0.01)
+                continue
+            process_round(validation_agent, email_processor, discovered_queues)
+    finally:
+        for process in processes:
+            process.terminate()
+
+    elapsed = time.time() - start_time
+    processed = sum(q["messages"] for q in result_agent.list_all_queues_details())
+    recorded = arrivals[-1][0] - arrivals[0][0] if arrivals else 0
+    return {
+        "speed": speed,
+        "workers": worker_count,
+        "files": len(arrivals),
+        "messages": sum(arrival[2] for arrival in arrivals),
+        "processed": processed,
+        "recorded_seconds": round(recorded, 3),
+        "elapsed_seconds": round(elapsed, 3),
+        "throughput": round(processed / elapsed, 2) if elapsed else None,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("capture", help="Capture file recorded with CAPTURE_FILE.")
+    parser.add_argument(
+        "--speed", type=float, default=1.0, help="Replay speed factor, e.g. 4 for 4x."
+    )
+    parser.add_argument(
+        "--workers", type=int, default=None, help="Number of stand-in workers."
+    )
+    args = parser.parse_args()
+
+    summary = replay(args.capture, speed=args.speed, workers=args.workers)
+    logger.info(f"Replay summary: {json.dumps(summary)}")
@@ -0,0 +1,219 @@
+import gzip
+import json
+import time
+import uuid
+
+from app.config import (
+    HOSTNAME,
+    RESULTS_CHUNK_ROWS,
+    RESULTS_CHUNK_SECONDS,
+    RESULTS_IDLE_SECONDS,
+    RESULTS_S3_PREFIX,
+    S3_BUCKET_NAME,
+)
+from app.utilities.logging import logger
+from app.utilities.s3 import put_object
+
+
+class _JobResults:
+    """Results of a job buffered for their next chunk object."""
+
+    def __init__(self, key_prefix, job_uid):
+        # Unique per job and replica run, the chunks are numbered after it
+        self.key_prefix = key_prefix
+        self.job_uid = job_uid
+
+        self.closed = False
+        self.keys = []
+        self.rows = 0
+
+        # Lines and (message, job_uid, on_complete) of the rows not uploaded yet
+        self.lines = []
+        self.pending = []
+        self.first_pending = None
+        self.last_message = None
+        self.updated = time.time()
+
+        # Marker not published yet, retried until it is
+        self.marker = None
+
+        # Consecutive failed uploads, and the time until which no results are taken
+        self.failures = 0
+        self.retry_at = 0
+
+
+class S3ResultsSink:
+    """
+    Writes the validation results of each job to S3 instead of the results queue.
+
+    The results of a job are uploaded in chunks of at most `chunk_rows` rows, or of the
+    rows of `chunk_seconds`, each chunk a gzipped JSON lines object of its own. A message
+    is only acknowledged once the chunk with its result is uploaded, so the unacknowledged
+    messages are bounded. Only compact progress and completion markers are published to
+    the results queue, so the broker load doesn't grow with the size of the files.
+
+    When a chunk fails to upload, its messages are requeued, and the job takes no new
+    results for an exponential backoff of up to `chunk_seconds`, so an S3 outage neither
+    holds messages unacknowledged nor costs an upload attempt per message.
+    """
+
+    def __init__(
+        self,
+        publish,
+        prefix=RESULTS_S3_PREFIX,
+        chunk_rows=RESULTS_CHUNK_ROWS,
+        chunk_seconds=RESULTS_CHUNK_SECONDS,
+        idle_seconds=RESULTS_IDLE_SECONDS,
+    ):
+        """
+        Args:
+            publish: Function publishing a marker to the results queue of a message,
+                called as `publish(message, job_uid, marker)`, returning True if published.
+        """
+        self.publish = publish
+        self.prefix = prefix
+        self.chunk_rows = chunk_rows
+        self.chunk_seconds = chunk_seconds
+        self.idle_seconds = idle_seconds
+
+        # Buffered results by queue name
+        self.jobs = {}
+
+    def accepting(self, queue_name):
+        """Whether new results of the queue are taken, False while its uploads back off."""
+        job = self.jobs.get(queue_name)
+        return job is None or time.time() >= job.retry_at
+
+    def add(self, message, job_uid, validation_result, on_complete):
+        """
+        Buffer the result of a message.
+
+        `on_complete(message, job_uid, succeeded)` is called once the chunk with
+        the result is uploaded, or right away if it can't be buffered.
+        """
+        queue_name = message.get("queueName")
+        job = self.jobs.get(queue_name)
+        if job is None:
+            key_prefix = (
+                f"{self.prefix}{job_uid or queue_name}/{HOSTNAME}-{uuid.uuid4().hex}"
+            )
+            job = _JobResults(key_prefix, job_uid)
+            self.jobs[queue_name] = job
+            logger.info(f"Started the results of queue {queue_name} at {key_prefix}.")
+        elif job.closed or not self.accepting(queue_name):
+            # The completion marker is being published, or the uploads are backing off
+            on_complete(message, job_uid, False)
+            return
+
+        now = time.time()
+        line = {**validation_result, "rowNumber": message.get("rowNumber")}
+        job.lines.append(json.dumps(line) + "\n")
+        job.pending.append((message, job_uid, on_complete))
+        if job.first_pending is None:
+            job.first_pending = now
+        job.last_message = message
+        job.updated = now
+
+        if (
+            len(job.pending) >= self.chunk_rows
+            or now - job.first_pending >= self.chunk_seconds
+        ):
+            self._upload_chunk(job)
+            self._publish_marker(job)
+
+    def _upload_chunk(self, job):
+        """
+        Upload the buffered rows of a job as its next chunk and complete them.
+
+        Returns:
+            True if no rows are left buffered, False if the upload failed.
+        """
+        if not job.pending:
+            return True
+
+        key = f"{job.key_prefix}-{len(job.keys) + 1:05d}.jsonl.gz"
+        try:
+            put_object(key, gzip.compress("".join(job.lines).encode()))
+        except Exception as e:
+            # Requeue the rows, and back off before taking new results of the job
+            job.failures += 1
+            delay = min(self.chunk_seconds, 2 ** (job.failures - 1))
+            job.retry_at = time.time() + delay
+            logger.error(
+                f"Error uploading the results chunk {key}, requeueing {len(job.pending)} rows and backing off for {delay} seconds: {e}"
+            )
+            pending, job.pending, job.lines = job.pending, [], []
+            job.first_pending = None
+            for message, job_uid, on_complete in pending:
+                on_complete(message, job_uid, False)
+            return False
+
+        job.failures = 0
+        job.keys.append(key)
+        job.rows += len(job.pending)
+        pending, job.pending, job.lines = job.pending, [], []
+        job.first_pending = None
+        for message, job_uid, on_complete in pending:
+            on_complete(message, job_uid, True)
+
+        if not job.closed:
+            job.marker = {"type": "progress", "key": key, "rows": job.rows}
+        logger.debug(f"Uploaded the results chunk {key}, {job.rows} rows.")
+        return True
+
+    def _publish_marker(self, job):
+        """Publish the pending marker of a job, returning False if it is still pending."""
+        if job.marker is None:
+            return True
+        if not self.publish(job.last_message, job.job_uid, job.marker):
+            logger.warning(
+                f"Failed to publish the {job.marker['type']} marker of {job.key_prefix}, retrying later."
+            )
+            return False
+        job.marker = None
+        return True
+
+    def finish(self, queue_name):
+        """
+        Upload the remaining results of a queue and publish its completion marker.
+
+        Returns:
+            True if there is nothing left to store for the queue, False otherwise.
+        """
+        job = self.jobs.get(queue_name)
+        if job is None:
+            return True
+
+        if not self._upload_chunk(job):
+            return False
+        if not job.closed:
+            job.closed = True
+            job.marker = {
+                "type": "complete",
+                "bucket": S3_BUCKET_NAME,
+                "keys": job.keys,
+                "rows": job.rows,
+            }
+        # The job is kept until its completion marker is published
+        if not self._publish_marker(job):
+            return False
+
+        del self.jobs[queue_name]
+        logger.info(
+            f"Completed the results of queue {queue_name} with {job.rows} rows in {len(job.keys)} chunks."
+        )
+        return True
+
+    def finish_idle(self):
+        """
+        Upload the chunks that are due, and complete the jobs that had no new results
+        for `idle_seconds`. Also retries the markers that failed to publish.
+        """
+        now = time.time()
+        for queue_name, job in list(self.jobs.items()):
+            if now - job.updated >= self.idle_seconds:
+                self.finish(queue_name)
+                continue
+            if job.pending and now - job.first_pending >= self.chunk_seconds:
+                self._upload_chunk(job)
+            self._publish_marker(job)
@@ -0,0 +1,74 @@
+import hashlib
+import math
+from collections import Counter, deque
+from functools import lru_cache
+
+from app.config import WORKER_AFFINITY_LOAD_FACTOR, WORKER_AFFINITY_WINDOW
+from app.utilities.autoscaling import scaling_signal
+from app.utilities.logging import logger
+
+
+@lru_cache(maxsize=10000)
+def rank_workers(domain, workers):
+    """
+    Rank the workers for a domain by rendezvous (highest random weight) hashing.
+
+    Each domain has its own stable order of the workers. Adding or removing a worker
+    only moves the domains for which that worker ranks first.
+    """
+    return sorted(
+        workers,
+        key=lambda worker: hashlib.blake2b(
+            f"{worker}|{domain}".encode(), digest_size=8
+        ).digest(),
+        reverse=True,
+    )
+
+
+class AffinityRouter:
+    """
+    Routes the emails of a domain to the same worker, to keep its DNS and SMTP caches warm.
+
+    Loads are bounded: of the recent `window` assignments, a worker takes at most
+    `load_factor` times its even share of the window. When the first worker of a domain
+    is full, the domain spills over to the next worker in its ranking, so a hot domain is
+    spread over a stable few workers.
+    """
+
+    def __init__(
+        self,
+        workers,
+        load_factor=WORKER_AFFINITY_LOAD_FACTOR,
+        window=WORKER_AFFINITY_WINDOW,
+    ):
+        self.workers = tuple(workers)
+        self.load_factor = load_factor
+        self.recent = deque(maxlen=window)
+        self.loads = Counter()
+
+    def route(self, email):
+        """Return the worker for the domain of the email."""
+        domain = email.rsplit("@", 1)[-1].lower() if email else ""
+        ranking = rank_workers(domain, self.workers)
+
+        # Capacity of each worker over a full window. Sizing it from the assignments made
+        # so far would allow one per worker while the window fills up, defeating affinity.
+        capacity = math.ceil(self.load_factor * self.recent.maxlen / len(ranking))
+        worker = next(
+            (worker for worker in ranking if self.loads[worker] < capacity), ranking[0]
+        )
+        spilled = worker != ranking[0]
+        scaling_signal.record_route(spilled)
+        if spilled:
+            logger.debug(
+                f"Domain {domain} spilled over from {ranking[0]} to {worker}, which is at capacity."
+            )
+
+        self._assign(worker)
+        return worker
+
+    def _assign(self, worker):
+        if len(self.recent) == self.recent.maxlen:
+            self.loads[self.recent[0]] -= 1
+        self.recent.append(worker)
+        self.loads[worker] += 1
@@ -0,0 +1,226 @@
+import json
+import math
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from app.config import AUTOSCALING_SMOOTHING, AUTOSCALING_TARGET_SECONDS
+from app.utilities.logging import logger
+
+
+def _ewma(previous, value, alpha=AUTOSCALING_SMOOTHING):
+    """Exponentially weighted moving average, seeded with the first value."""
+    if previous is None:
+        return value
+    return alpha * value + (1 - alpha) * previous
+
+
+class ScalingSignal:
+    """
+    Scaling signal computed from the queue discovery payloads.
+
+    The main loop feeds it the management API payloads of both vhosts once per round,
+    and the processing timings of each message. The HTTP endpoint serves a snapshot of it
+    so that a horizontal autoscaler can size the orchestrator replicas and validation workers.
+    """
+
+    def __init__(self, target_seconds=AUTOSCALING_TARGET_SECONDS):
+        self.target_seconds = target_seconds
+        self.lock = threading.Lock()
+
+        self.backlog = 0
+        self.drain_rate = None
+        self.message_seconds = None
+        self.replica_throughput = None
+        self.processed = 0
+        self.observed_processed = 0
+        self.worker_seconds = None
+        self.batches = 0
+        self.batch_size = None
+        self.batch_wait_seconds = None
+        self.routed = 0
+        self.spilled = 0
+        self.jobs = {}
+        self.last_observed = None
+
+    def record_processed(self, seconds):
+        """Record how long this replica took to process one message end to end."""
+        with self.lock:
+            self.processed += 1
+            self.message_seconds = _ewma(self.message_seconds, seconds)
+
+    def record_worker_latency(self, seconds):
+        """Record how long a validation worker took to respond."""
+        with self.lock:
+            self.worker_seconds = _ewma(self.worker_seconds, seconds)
+
+    def record_batch(self, size, wait_seconds):
+        """Record the size of a batch sent to a worker, and how long it waited to fill up."""
+        with self.lock:
+            self.batches += 1
+            self.batch_size = _ewma(self.batch_size, size)
+            self.batch_wait_seconds = _ewma(self.batch_wait_seconds, wait_seconds)
+
+    def record_route(self, spilled):
+        """Record an email routed by domain affinity, and whether it spilled over."""
+        with self.lock:
+            self.routed += 1
+            self.spilled += spilled
+
+    def observe(self, validation_queues, result_queues):
+        """
+        Update the signal from the queue details of both vhosts.
+
+        Args:
+            validation_queues: Queue details from vhost `RABBITMQ_DEFAULT_VHOSTS[0]`.
+            result_queues: Queue details from vhost `RABBITMQ_DEFAULT_VHOSTS[1]`.
+        """
+        now = time.time()
+        ready_by_queue = {
+            queue.get("name"): queue.get("messages_ready", 0) or 0
+            for queue in validation_queues
+        }
+
+        with self.lock:
+            elapsed = now - self.last_observed if self.last_observed else None
+            self.last_observed = now
+
+            # Messages processed since the last observation, over the wall-clock time of the
+            # whole loop iteration, polling sleeps and management API calls included.
+            # Idle intervals would measure the arrival rate instead, so only the ones
+            # that started with a backlog count.
+            if elapsed and self.backlog:
+                processed = self.processed - self.observed_processed
+                self.replica_throughput = _ewma(
+                    self.replica_throughput, processed / elapsed
+                )
+            self.observed_processed = self.processed
+            self.backlog = sum(ready_by_queue.values())
+
+            jobs = {}
+            drained = 0
+            for queue in result_queues:
+                name = queue.get("name")
+                arguments = queue.get("arguments", {}) or {}
+                completed = queue.get("messages", 0) or 0
+                previous = self.jobs.get(name)
+
+                rate = previous["rate"] if previous else None
+                if previous and elapsed:
+                    # Result queues only shrink when the result file is being generated
+                    delta = max(completed - previous["completed"], 0)
+                    drained += delta
+                    rate = _ewma(rate, delta / elapsed)
+
+                jobs[name] = {
+                    "job_uid": arguments.get("jobuid"),
+                    "row_count": arguments.get("row_count"),
+                    "completed": completed,
+                    "ready": ready_by_queue.get(name, 0),
+                    "rate": rate,
+                }
+            self.jobs = jobs
+
+            if elapsed:
+                self.drain_rate = _ewma(self.drain_rate, drained / elapsed)
+
+    def recommendation(self):
+        """
+        Recommend replica and worker counts to complete the backlog in the target time.
+
+        Replica count divides the required rate by the measured throughput of this replica,
+        which accounts for the time spent outside of processing messages, like the polling
+        sleeps and the management API calls. Worker count follows Little's law:
+        the number of requests in flight is the arrival rate times the worker latency.
+        """
+        required_rate = self.backlog / self.target_seconds
+        replicas = None
+        workers = None
+        if self.replica_throughput:
+            replicas = max(1, math.ceil(required_rate / self.replica_throughput))
+        if self.worker_seconds:
+            workers = max(1, math.ceil(required_rate * self.worker_seconds))
+
+        return {
+            "target_seconds": self.target_seconds,
+            "required_rate": required_rate,
+            "replicas": replicas,
+            "workers": workers,
+        }
+
+    def snapshot(self):
+        """Return the current signal as a JSON serializable dict."""
+        with self.lock:
+            jobs = []
+            for name, job in self.jobs.items():
+                eta = None
+                if job["row_count"] is not None and job["rate"]:
+                    remaining = max(job["row_count"] - job["completed"], 0)
+                    eta = remaining / job["rate"]
+                jobs.append(
+                    {
+                        "queue": name,
+                        "job_uid": job["job_uid"],
+                        "row_count": job["row_count"],
+                        "completed": job["completed"],
+                        "ready": job["ready"],
+                        "drain_rate": job["rate"],
+                        "eta_seconds": eta,
+                    }
+                )
+
+            drain_rate = self.drain_rate
+            return {
+                "backlog": self.backlog,
+                "drain_rate": drain_rate,
+                "eta_seconds": (self.backlog / drain_rate if drain_rate else None),
+                "message_seconds": self.message_seconds,
+                "replica_throughput": self.replica_throughput,
+                "worker_seconds": self.worker_seconds,
+                "batching": {
+                    "batches": self.batches,
+                    "batch_size": self.batch_size,
+                    "wait_seconds": self.batch_wait_seconds,
+                },
+                "routing": {
+                    "routed": self.routed,
+                    "spilled": self.spilled,
+                    "spill_ratio": (
+                        self.spilled / self.routed if self.routed else None
+                    ),
+                },
+                "observed_at": self.last_observed,
+                "jobs": jobs,
+                "recommendation": self.recommendation(),
+            }
+
+
+scaling_signal = ScalingSignal()
+
+
+class _ScalingRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.rstrip("/") not in ("", "/scaling"):
+            self.send_error(404)
+            return
+
+        body = json.dumps(scaling_signal.snapshot()).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug(f"Scaling endpoint: {format % args}")
+
+
+def start_scaling_server(port):
+    """
+    Serve the scaling signal at `http://0.0.0.0:<port>/scaling` from a daemon thread.
+    """
+    server = ThreadingHTTPServer(("0.0.0.0", port), _ScalingRequestHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    logger.info(f"Serving the scaling signal on port {port}.")
+    return server
@@ -0,0 +1,167 @@
+import atexit
+import gzip
+import hashlib
+import json
+import threading
+import time
+import zlib
+
+from app.config import CAPTURE_FILE, CAPTURE_FLUSH_SECONDS
+from app.utilities.logging import logger
+
+
+def anonymise(value):
+    """Stable short hash, so that captures keep the grouping but not the names."""
+    return hashlib.blake2b(str(value).encode(), digest_size=6).hexdigest()
+
+
+def email_domain(email):
+    return email.rsplit("@", 1)[-1].lower() if email and "@" in email else ""
+
+
+class Recorder:
+    """
+    Records the traffic of the orchestrator to a compact local file for replays.
+
+    Each line of the gzipped file is one event:
+    - `{"e": "f", "t", "q", "n", "r", "x"}`: Queue `q` of a file with `n` rows was first
+      discovered, with `r` messages ready. `x` is set for the queues that already existed
+      when the capture started.
+    - `{"e": "m", "t", "q", "d", "n"}`: A message was consumed from queue `q`, with its
+      domain `d` and the total rows `n` of its file.
+    - `{"e": "v", "t", "w", "d", "ms", "s", "r"}`: Worker `w` responded to an email of domain `d`
+      in `ms` milliseconds with HTTP status `s` and result status `r`.
+
+    Queue names and workers are anonymised, and the local part of the emails is dropped.
+
+    The events are buffered, and appended every `flush_seconds` as a self-contained gzip
+    member, so a killed process only loses the events of its last interval.
+    """
+
+    def __init__(self, path=CAPTURE_FILE, flush_seconds=CAPTURE_FLUSH_SECONDS):
+        self.path = path
+        self.flush_seconds = flush_seconds
+        self.lock = threading.Lock()
+        self.buffer = []
+        self.last_flush = None
+
+        # Anonymised names of the queues discovered so far, None before the first discovery
+        self.seen_queues = None
+
+    @property
+    def enabled(self):
+        return bool(self.path)
+
+    def _write(self, event):
+        now = time.time()
+        event["t"] = round(now, 3)
+        line = json.dumps(event, separators=(",", ":")) + "\n"
+        with self.lock:
+            if self.last_flush is None:
+                self.last_flush = now
+                atexit.register(self.close)
+            self.buffer.append(line)
+            if now - self.last_flush >= self.flush_seconds:
+                self._flush()
+
+    def flush_due(self):
+        """Write the buffered events if the interval is due, also without new events."""
+        with self.lock:
+            if (
+                self.last_flush is not None
+                and time.time() - self.last_flush >= self.flush_seconds
+            ):
+                self._flush()
+
+    def _flush(self):
+        self.last_flush = time.time()
+        if not self.buffer:
+            return
+        lines, self.buffer = self.buffer, []
+        try:
+            # Each write is a complete gzip member, members are read back as one stream
+            with open(self.path, "ab") as capture_file:
+                capture_file.write(gzip.compress("".join(lines).encode()))
+        except OSError as e:
+            logger.error(f"Error writing capture to {self.path}: {e}")
+
+    def record_queues(self, queues_details):
+        """Record the queues discovered for the first time, from the discovery payload."""
+        if not self.enabled:
+            return
+        existing = self.seen_queues is None
+        if existing:
+            self.seen_queues = set()
+        for queue in queues_details:
+            name = anonymise(queue.get("name"))
+            if name in self.seen_queues:
+                continue
+            self.seen_queues.add(name)
+            arguments = queue.get("arguments", {}) or {}
+            event = {
+                "e": "f",
+                "q": name,
+                "n": arguments.get("row_count"),
+                "r": queue.get("messages_ready", 0) or 0,
+            }
+            if existing:
+                event["x"] = 1
+            self._write(event)
+
+    def record_message(self, queue_name, message):
+        if not self.enabled:
+            return
+        self._write(
+            {
+                "e": "m",
+                "q": anonymise(queue_name),
+                "d": email_domain(message.get("email")),
+                "n": message.get("totalRows", 0),
+            }
+        )
+
+    def record_validation(self, worker, email, seconds, status_code, result):
+        if not self.enabled:
+            return
+        self._write(
+            {
+                "e": "v",
+                "w": anonymise(worker),
+                "d": email_domain(email),
+                "ms": round(seconds * 1000, 1),
+                "s": status_code,
+                "r": result.get("status") if isinstance(result, dict) else None,
+            }
+        )
+
+    def close(self):
+        with self.lock:
+            self._flush()
+
+
+def read_capture(path):
+    """
+    Read the events of a capture file, sorted by time.
+
+    A capture cut off in the middle of a write, e.g. by a kill or a full disk,
+    keeps the events before its truncated tail.
+    """
+    lines = []
+    try:
+        with gzip.open(path, "rt") as capture_file:
+            for line in capture_file:
+                lines.append(line)
+    except (EOFError, gzip.BadGzipFile, zlib.error) as e:
+        logger.warning(f"Capture {path} is truncated, reading the events before: {e}")
+
+    events = []
+    for line in lines:
+        try:
+            events.append(json.loads(line))
+        except json.JSONDecodeError:
+            # Only the last line of a truncated member can be incomplete
+            continue
+    return sorted(events, key=lambda event: event["t"])
+
+
+recorder = Recorder()
@@ -0,0 +1,279 @@
+import random
+import threading
+
+import pika
+
+from app.config import RABBITMQ_RECONNECT_BASE_DELAY, RABBITMQ_RECONNECT_MAX_DELAY
+from app.utilities.logging import logger
+
+
+class ConnectionUnavailable(Exception):
+    """Raised when an operation is attempted while its connection is down."""
+
+
+class ManagedChannel:
+    """
+    A RabbitMQ connection with a single dedicated channel.
+
+    It behaves like a circuit breaker: the first failure opens the circuit, and the
+    operations fail fast with ConnectionUnavailable while a background thread reconnects
+    with jittered exponential backoff. The circuit closes when the reconnect succeeds.
+
+    With `watch_blocked`, a connection blocked by the broker's publisher flow control
+    (memory or disk alarm) is treated like an open circuit, instead of blocking the caller
+    in basic_publish for up to `blocked_connection_timeout`.
+
+    Delivery tags are only valid on the channel that delivered them, so the unacked
+    delivery tags are tracked per channel generation and invalidated when it is lost.
+    """
+
+    def __init__(
+        self,
+        name,
+        parameters,
+        prefetch_count=None,
+        watch_blocked=False,
+        base_delay=RABBITMQ_RECONNECT_BASE_DELAY,
+        max_delay=RABBITMQ_RECONNECT_MAX_DELAY,
+    ):
+        self.name = name
+        self.parameters = parameters
+        self.prefetch_count = prefetch_count
+        self.watch_blocked = watch_blocked
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.reconnect_thread = None
+
+        self.connection = None
+        self.channel = None
+        self.circuit_open = False
+        self.blocked = False
+
+        # Incremented with every new channel, delivery tags are scoped to it
+        self.generation = 0
+        self.unacked = set()
+
+    def open(self):
+        """Open the connection and its channel, raising on failure."""
+        connection = pika.BlockingConnection(self.parameters)
+        channel = connection.channel()
+        if self.prefetch_count:
+            channel.basic_qos(prefetch_count=self.prefetch_count)
+        if self.watch_blocked:
+            connection.add_on_connection_blocked_callback(self._on_blocked)
+            connection.add_on_connection_unblocked_callback(self._on_unblocked)
+
+        with self.lock:
+            previous = self.connection
+            self.connection = connection
+            self._set_channel(channel)
+            self.circuit_open = False
+            self.blocked = False
+        self._close_quietly(previous)
+
+        logger.debug(
+            f"Opened RabbitMQ {self.name} channel to {self.parameters.host}:{self.parameters.port}/{self.parameters.virtual_host}"
+        )
+
+    def connect(self):
+        """
+        Try to connect once, and keep reconnecting in the background if that fails.
+
+        Returns:
+            True if connected, False if reconnecting in the background.
+        """
+        self.stop_event.clear()
+        try:
+            self.open()
+            return True
+        except Exception as e:
+            logger.warning(f"Failed to open the RabbitMQ {self.name} connection: {e}")
+            self.handle_failure(e)
+            return False
+
+    def close(self):
+        """Stop reconnecting and close the connection."""
+        self.stop_event.set()
+        with self.lock:
+            connection = self.connection
+            self.connection = None
+            self.channel = None
+            self.unacked = set()
+        self._close_quietly(connection)
+
+    @property
+    def is_open(self):
+        return (
+            not self.circuit_open
+            and not self.blocked
+            and self.channel is not None
+            and self.channel.is_open
+        )
+
+    def get_channel(self):
+        """
+        Return the channel, failing fast while the circuit is open.
+
+        Raises:
+            ConnectionUnavailable: If the connection is down, or blocked by the broker.
+        """
+        if self.watch_blocked:
+            self._process_events()
+
+        with self.lock:
+            if self.circuit_open or self.channel is None:
+                raise ConnectionUnavailable(
+                    f"RabbitMQ {self.name} connection to {self.parameters.virtual_host} is down."
+                )
+            if self.blocked:
+                raise ConnectionUnavailable(
+                    f"RabbitMQ {self.name} connection to {self.parameters.virtual_host} is blocked by the broker."
+                )
+            return self.channel
+
+    def _process_events(self):
+        # BlockingConnection only dispatches the blocked and unblocked notifications from
+        # process_data_events, basic_publish and queue_declare don't, so poll before
+        # every operation. This also answers the heartbeats of an idle publisher.
+        connection = self.connection
+        if self.circuit_open or connection is None or not connection.is_open:
+            return
+        try:
+            connection.process_data_events(time_limit=0)
+        except Exception as e:
+            self.handle_failure(e)
+
+    def _on_blocked(self, connection, method_frame):
+        if connection is not self.connection:
+            return
+        self.blocked = True
+        logger.warning(
+            f"RabbitMQ {self.name} connection is blocked by the broker: {method_frame.method.reason}"
+        )
+
+    def _on_unblocked(self, connection, method_frame):
+        if connection is not self.connection:
+            return
+        self.blocked = False
+        logger.info(f"RabbitMQ {self.name} connection is unblocked.")
+
+    def track(self, delivery_tag):
+        """Track an unacked delivery tag, returning the generation of its channel."""
+        with self.lock:
+            self.unacked.add(delivery_tag)
+            return self.generation
+
+    def release(self, delivery_tag, generation):
+        """
+        Stop tracking a delivery tag before it is acked or rejected.
+
+        Returns:
+            True if the delivery tag is still valid on the current channel, False if it
+            was delivered by a lost channel or it has already been acked or rejected.
+        """
+        with self.lock:
+            if generation != self.generation or delivery_tag not in self.unacked:
+                return False
+            self.unacked.discard(delivery_tag)
+            return True
+
+    def handle_failure(self, error):
+        """
+        Recover from a failed operation without blocking the caller.
+
+        If only the channel was closed (e.g. by a channel error from the broker),
+        a new channel is opened on the same connection. Otherwise the circuit is opened
+        and the connection is re-established in the background.
+        """
+        with self.lock:
+            if self.circuit_open:
+                return
+
+            if self.connection and self.connection.is_open:
+                try:
+                    channel = self.connection.channel()
+                    if self.prefetch_count:
+                        channel.basic_qos(prefetch_count=self.prefetch_count)
+                    self._set_channel(channel)
+                    logger.warning(
+                        f"Reopened the RabbitMQ {self.name} channel after error: {error}"
+                    )
+                    return
+                except Exception as e:
+                    logger.warning(
+                        f"Failed to reopen the RabbitMQ {self.name} channel: {e}"
+                    )
+
+            self.circuit_open = True
+            self.blocked = False
+            self.channel = None
+            self.unacked = set()
+            self.reconnect_thread = threading.Thread(
+                target=self._reconnect, daemon=True
+            )
+            self.reconnect_thread.start()
+
+    def _set_channel(self, channel):
+        # Delivery tags of the previous channel can no longer be acked or rejected
+        self.channel = channel
+        self.generation += 1
+        self.unacked = set()
+
+    def _reconnect(self):
+        attempt = 0
+        while not self.stop_event.is_set():
+            # Full jitter, so that the replicas don't reconnect in lockstep
+            delay = random.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))
+            logger.warning(
+                f"RabbitMQ {self.name} connection is down, reconnection attempt {attempt + 1} in {delay:.1f} seconds."
+            )
+            if self.stop_event.wait(delay):
+                return
+
+            try:
+                self.open()
+                logger.info(f"Reconnected the RabbitMQ {self.name} connection.")
+                return
+            except Exception as e:
+                logger.warning(
+                    f"Reconnection attempt {attempt + 1} of the RabbitMQ {self.name} connection failed: {e}"
+                )
+                attempt += 1
+
+    @staticmethod
+    def _close_quietly(connection):
+        try:
+            if connection and not connection.is_closed:
+                connection.close()
+        except Exception:
+            pass
+
+
+class ConnectionManager:
+    """
+    Dedicated consumer and publisher connections to a RabbitMQ vhost.
+
+    RabbitMQ applies publisher flow control to the whole connection, so the publisher
+    gets its own connection, and a blocked publisher does not stop consumption.
+    """
+
+    def __init__(self, parameters):
+        # Only allow one unacknowledged message at a time
+        self.consumer = ManagedChannel("consumer", parameters, prefetch_count=1)
+        self.publisher = ManagedChannel("publisher", parameters, watch_blocked=True)
+
+    def connect(self):
+        consumer_connected = self.consumer.connect()
+        publisher_connected = self.publisher.connect()
+        return consumer_connected and publisher_connected
+
+    def close(self):
+        self.consumer.close()
+        self.publisher.close()
+
+    @property
+    def is_open(self):
+        return self.consumer.is_open and self.publisher.is_open
@@ -9,7 +9,12 @@ from sqlalchemy import (
     DateTime,
     ForeignKey,
 )
-from sqlalchemy.orm import sessionmaker, declarative_base, relationship
+from sqlalchemy.orm import (
+    sessionmaker,
+    scoped_session,
+    declarative_base,
+    relationship,
+)
 
 from app.config import DATABASE_CONNECTION_STRING, appTimezone
 
@@ -45,6 +50,9 @@ class BatchJobs(Base):
         DateTime(),
         nullable=True,
     )
+    # `processed_rows`, the number of rows validated so far, is written in bulk by
+    # JobProgressWriter through Core. It isn't mapped, so that the queries and inserts
+    # of the other helpers work on databases without the column.
 
 
 class Users(Base):
@@ -67,6 +75,9 @@ class Users(Base):
 Session = sessionmaker(bind=engine)
 session = Session()
 
+# Thread-local sessions for components running off the processing thread
+ScopedSession = scoped_session(Session)
+
 
 def update_job_status(file, **kwargs):
     job = session.query(BatchJobs).filter_by(accepted_file=file).first()
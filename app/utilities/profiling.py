@@ -0,0 +1,89 @@
+import os
+import signal
+import sys
+import threading
+import time
+from collections import Counter
+
+from app.config import PROFILE_DIR, PROFILE_INTERVAL, PROFILE_SECONDS
+from app.utilities.logging import logger
+
+
+class SamplingProfiler:
+    """
+    Samples the stacks of all threads of the process for a number of seconds.
+
+    The profile is written in the folded stacks format (one `frame;frame;frame count`
+    line per stack), ready for flamegraph.pl or speedscope.
+    """
+
+    def __init__(
+        self, seconds=PROFILE_SECONDS, interval=PROFILE_INTERVAL, directory=PROFILE_DIR
+    ):
+        self.seconds = seconds
+        self.interval = interval
+        self.directory = directory
+        self.thread = None
+
+    @property
+    def running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def start(self):
+        """Profile in a background thread, unless a profile is already in progress."""
+        if self.running:
+            logger.warning("A profile is already in progress.")
+            return False
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        return True
+
+    def _run(self):
+        logger.info(f"Profiling the orchestrator for {self.seconds} seconds.")
+        own_thread = threading.get_ident()
+        thread_names = {}
+        stacks = Counter()
+
+        end_time = time.time() + self.seconds
+        while time.time() < end_time:
+            for thread in threading.enumerate():
+                thread_names[thread.ident] = thread.name
+
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_thread:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(
+                        f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+                    )
+                    frame = frame.f_back
+                stack.append(thread_names.get(thread_id, str(thread_id)))
+                stacks[";".join(reversed(stack))] += 1
+
+            time.sleep(self.interval)
+
+        path = os.path.join(
+            self.directory, f"profile-{os.getpid()}-{int(time.time())}.folded"
+        )
+        try:
+            with open(path, "w") as profile_file:
+                for stack, count in stacks.most_common():
+                    profile_file.write(f"{stack} {count}\n")
+            logger.info(
+                f"Wrote the profile with {sum(stacks.values())} samples to {path}."
+            )
+        except OSError as e:
+            logger.error(f"Error writing profile to {path}: {e}")
+
+
+profiler = SamplingProfiler()
+
+
+def install_profiler_signal():
+    """Start a profile when the process receives SIGUSR1."""
+    if not hasattr(signal, "SIGUSR1"):
+        logger.warning("SIGUSR1 is not available, the profiler can't be triggered.")
+        return
+    signal.signal(signal.SIGUSR1, lambda signum, frame: profiler.start())
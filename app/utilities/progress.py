@@ -0,0 +1,125 @@
+import atexit
+import threading
+from collections import defaultdict
+
+from sqlalchemy import Integer, case, column, func, select, table, update
+
+from app.config import PROGRESS_FLUSH_INTERVAL
+from app.utilities.database import BatchJobs, ScopedSession
+from app.utilities.logging import logger
+
+# The progress column isn't mapped on BatchJobs, it only has to exist with progress enabled
+_batch_jobs_progress = table(
+    "BatchJobs", column("id", Integer), column("processed_rows", Integer)
+)
+
+
+class JobProgressWriter:
+    """
+    Coalesces the progress of the jobs and writes it to the BatchJobs table in bulk.
+
+    The processing loop only increments in-memory counters. A background thread flushes
+    all counters accumulated in an interval with a single UPDATE statement, so that the
+    database load does not grow with the number of validated emails.
+    """
+
+    def __init__(self, flush_interval=PROGRESS_FLUSH_INTERVAL):
+        self.flush_interval = flush_interval
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread = None
+
+        # Rows processed since the last flush, keyed by job uid
+        self.pending = defaultdict(int)
+
+        # BatchJobs.id by job uid, None for the uids that don't have a job
+        self.job_ids = {}
+
+    def start(self):
+        """Start flushing the counters in the background."""
+        if self.thread and self.thread.is_alive():
+            return
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        atexit.register(self.stop)
+
+    def stop(self):
+        """Stop the background thread and flush the remaining counters."""
+        self.stop_event.set()
+        if self.thread:
+            self.thread.join()
+            self.thread = None
+        self.flush()
+
+    def record(self, job_uid, rows=1):
+        """Count rows as processed for a job, without touching the database."""
+        if not job_uid:
+            return
+        with self.lock:
+            self.pending[job_uid] += rows
+
+    def _run(self):
+        while not self.stop_event.wait(self.flush_interval):
+            self.flush()
+
+    def _get_job_ids(self, session, job_uids):
+        """Look up the ids of the jobs, querying only the uids that are not cached."""
+        missing = [uid for uid in job_uids if uid not in self.job_ids]
+        if missing:
+            rows = session.execute(
+                select(BatchJobs.uid, BatchJobs.id).where(BatchJobs.uid.in_(missing))
+            ).all()
+            found = dict(rows)
+            for uid in missing:
+                self.job_ids[uid] = found.get(uid)
+                if uid not in found:
+                    logger.warning(f"No job found in the database for job uid {uid}.")
+
+        return {uid: self.job_ids[uid] for uid in job_uids}
+
+    def flush(self):
+        """
+        Write the accumulated counters with a single UPDATE statement.
+
+        Returns:
+            The number of rows written to the database.
+        """
+        with self.lock:
+            pending, self.pending = self.pending, defaultdict(int)
+        if not pending:
+            return 0
+
+        session = ScopedSession()
+        try:
+            increments = {}
+            for uid, job_id in self._get_job_ids(session, list(pending)).items():
+                if job_id is not None:
+                    increments[job_id] = increments.get(job_id, 0) + pending[uid]
+
+            if increments:
+                session.execute(
+                    update(_batch_jobs_progress)
+                    .where(_batch_jobs_progress.c.id.in_(increments))
+                    .values(
+                        processed_rows=func.coalesce(
+                            _batch_jobs_progress.c.processed_rows, 0
+                        )
+                        + case(increments, value=_batch_jobs_progress.c.id)
+                    )
+                )
+                session.commit()
+                logger.debug(f"Flushed the progress of {len(increments)} jobs.")
+
+            return sum(increments.values())
+        except Exception as e:
+            session.rollback()
+            logger.error(f"Error flushing the job progress: {e}")
+
+            # Put the counters back to retry them with the next flush
+            with self.lock:
+                for uid, rows in pending.items():
+                    self.pending[uid] += rows
+            return 0
+        finally:
+            ScopedSession.remove()
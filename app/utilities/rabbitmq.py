@@ -4,6 +4,7 @@ from app.config import (
     RABBITMQ_USERNAME,
     RABBITMQ_PASSWORD,
 )
+from app.utilities.connection import ConnectionManager, ConnectionUnavailable
 from app.utilities.logging import logger
 import requests
 import pika
@@ -16,6 +17,9 @@ class QueueAgent:
     Agent to manage RabbitMQ queues and connections.
 
     For each vhost, create a different instance of this class.
+
+    Consuming and publishing use dedicated connections managed by a ConnectionManager.
+    Operations fail fast while a connection is down, and it is re-established in the background.
     """
 
     def __init__(
@@ -33,55 +37,52 @@ class QueueAgent:
         self.rabbitmq_password = rabbitmq_password
 
         self.url = f"https://{self.rabbitmq_host}/api/queues/{self.rabbitmq_vhost.replace('/', '%2F')}"
-        self.connection = None
-        self.channel = None
+        self.connection_manager = None
 
         # Connect to RabbitMQ on initialization
         self.connect()
 
     def connect(self):
-        """Connect to RabbitMQ via AMQP with retry logic"""
-        max_retries = 5
-        retry_delay = 5  # seconds
-
-        for attempt in range(max_retries):
-            try:
-                credentials = pika.PlainCredentials(
-                    self.rabbitmq_username, self.rabbitmq_password
-                )
-                parameters = pika.ConnectionParameters(
-                    host=self.rabbitmq_host,
-                    port=self.rabbitmq_port,
-                    virtual_host=self.rabbitmq_vhost,
-                    credentials=credentials,
-                    heartbeat=600,
-                    blocked_connection_timeout=300,
-                )
-                self.connection = pika.BlockingConnection(parameters)
-                self.channel = self.connection.channel()
+        """
+        Connect to RabbitMQ via AMQP.
 
-                # Only allow one unacknowledged message at a time
-                self.channel.basic_qos(prefetch_count=1)
+        If the broker is unreachable, the connections are retried in the background
+        with jittered exponential backoff instead of blocking the caller.
+        """
+        credentials = pika.PlainCredentials(
+            self.rabbitmq_username, self.rabbitmq_password
+        )
+        parameters = pika.ConnectionParameters(
+            host=self.rabbitmq_host,
+            port=self.rabbitmq_port,
+            virtual_host=self.rabbitmq_vhost,
+            credentials=credentials,
+            heartbeat=600,
+            blocked_connection_timeout=300,
+        )
+        if self.connection_manager:
+            self.connection_manager.close()
+        self.connection_manager = ConnectionManager(parameters)
 
-                logger.debug(
-                    f"Connected to RabbitMQ at {self.rabbitmq_host}:{self.rabbitmq_port}/{self.rabbitmq_vhost}"
-                )
-                return True
-            except Exception as e:
-                logger.warning(
-                    f"Connection attempt {attempt + 1}/{max_retries} failed: {e}"
-                )
-                if attempt < max_retries - 1:
-                    time.sleep(retry_delay)
-        logger.error("Failed to connect to RabbitMQ after multiple attempts.")
+        if self.connection_manager.connect():
+            logger.debug(
+                f"Connected to RabbitMQ at {self.rabbitmq_host}:{self.rabbitmq_port}/{self.rabbitmq_vhost}"
+            )
+            return True
+        logger.error(
+            f"Failed to connect to RabbitMQ at {self.rabbitmq_host}:{self.rabbitmq_port}/{self.rabbitmq_vhost}, reconnecting in the background."
+        )
         return False
 
+    def is_connected(self):
+        """Whether both the consumer and the publisher connections are up."""
+        return self.connection_manager.is_open
+
     def disconnect(self):
         """Gracefully disconnect from RabbitMQ"""
         try:
-            if self.connection and not self.connection.is_closed:
-                self.connection.close()
-                logger.debug("Disconnected from RabbitMQ.")
+            self.connection_manager.close()
+            logger.debug("Disconnected from RabbitMQ.")
         except Exception as e:
             logger.error(f"Error disconnecting from RabbitMQ: {e}")
 
@@ -110,7 +111,7 @@ class QueueAgent:
         """
         List all queues in the RabbitMQ vhost specified for the parent.
         """
-        queues_details = self.list_all_queues_details()
+        queues_details = self.list_all_queues_details() or []
 
         queue_names = [queue.get("name") for queue in queues_details]
         return queue_names
@@ -119,21 +120,19 @@ class QueueAgent:
         """
         Create a queue in RabbitMQ if it does not exist.
         """
+        publisher = self.connection_manager.publisher
         try:
             # Declare the queue (idempotent operation)
-            self.channel.queue_declare(
+            publisher.get_channel().queue_declare(
                 queue=queue_name, arguments=arguments, durable=True
             )
             logger.debug(f"Created queue: '{queue_name}'.")
             return True
+        except ConnectionUnavailable as e:
+            logger.warning(f"Cannot create queue '{queue_name}': {e}")
         except Exception as e:
             logger.warning(f"Error creating queue '{queue_name}': {e}")
-            # Try to reconnect and get message again
-            if self.connect():
-                logger.debug("Reconnected successfully.")
-                return self.create_queue(queue_name, arguments=arguments)
-            else:
-                logger.error("Reconnection attempt from create_queue() failed.")
+            publisher.handle_failure(e)
 
         return False
 
@@ -141,22 +140,16 @@ class QueueAgent:
         """
         Delete a queue in RabbitMQ if it exists.
         """
+        publisher = self.connection_manager.publisher
         try:
-            self.channel.queue_delete(queue=queue_name)
+            publisher.get_channel().queue_delete(queue=queue_name)
             logger.debug(f"Deleted queue: '{queue_name}'.")
             return True
+        except ConnectionUnavailable as e:
+            logger.warning(f"Cannot delete queue '{queue_name}': {e}")
         except Exception as e:
             logger.warning(f"Error deleting queue '{queue_name}': {e}")
-
-            # Try to reconnect and delete again
-            logger.warning(
-                "Connection is closed. Attempting to reconnect and try deleting again."
-            )
-            if self.connect():
-                logger.debug("Reconnected successfully.")
-                self.delete_queue(queue_name)
-            else:
-                logger.error("Reconnection attempt from delete_queue() failed.")
+            publisher.handle_failure(e)
 
         return False
 
@@ -171,8 +164,9 @@ class QueueAgent:
         Returns:
             True if the message was published successfully, False otherwise.
         """
+        publisher = self.connection_manager.publisher
         try:
-            self.channel.basic_publish(
+            publisher.get_channel().basic_publish(
                 exchange="",
                 routing_key=queue_name,
                 body=json.dumps(message_body),
@@ -184,18 +178,11 @@ class QueueAgent:
                 f"Published message to vhost '{self.rabbitmq_vhost}', queue '{queue_name}'."
             )
             return True
+        except ConnectionUnavailable as e:
+            logger.warning(f"Cannot publish message to queue '{queue_name}': {e}")
         except Exception as e:
             logger.warning(f"Error publishing message to queue '{queue_name}': {e}")
-
-            # Try to reconnect and get message again
-            logger.warning(
-                "Connection is closed. Attempting to reconnect and try getting message again."
-            )
-            if self.connect():
-                logger.debug("Reconnected successfully.")
-                return self.publish_message(queue_name, message_body)
-            else:
-                logger.error("Reconnection attempt from publish_message() failed.")
+            publisher.handle_failure(e)
 
         return False
 
@@ -259,8 +246,9 @@ class QueueAgent:
         Returns:
             The message body as a dict if a message is available, None otherwise.
         """
+        consumer = self.connection_manager.consumer
         try:
-            method_frame, properties, body = self.channel.basic_get(
+            method_frame, properties, body = consumer.get_channel().basic_get(
                 queue=queue_name, auto_ack=auto_ack
             )
             if method_frame:
@@ -270,22 +258,20 @@ class QueueAgent:
                 message = json.loads(body)
                 # Append the delivery_tag for ack/nack operations
                 message["delivery_tag"] = method_frame.delivery_tag
+                if not auto_ack:
+                    # Delivery tags are only valid on the channel that delivered them
+                    message["delivery_channel"] = consumer.track(
+                        method_frame.delivery_tag
+                    )
                 return message
             else:
                 logger.debug(f"No messages in queue '{queue_name}'.")
                 return None
+        except ConnectionUnavailable as e:
+            logger.warning(f"Cannot retrieve message from queue '{queue_name}': {e}")
         except Exception as e:
             logger.warning(f"Error retrieving message from queue '{queue_name}': {e}")
-
-            # Try to reconnect and get message again
-            logger.warning(
-                "Connection is closed. Attempting to reconnect and try getting message again."
-            )
-            if self.connect():
-                logger.debug("Reconnected successfully.")
-                return self.get_message(queue_name, auto_ack=auto_ack)
-            else:
-                logger.error("Reconnection attempt from get_message() failed.")
+            consumer.handle_failure(e)
 
         return None
 
@@ -314,6 +300,11 @@ class QueueAgent:
             message = self.get_message(queue_name, auto_ack=True)
             if message:
                 messages_retrieved.append(message)
+            elif not self.connection_manager.consumer.is_open:
+                logger.error(
+                    f"Connection lost while draining queue '{queue_name}', retrieved {len(messages_retrieved)} messages."
+                )
+                break
             else:
                 logger.error(
                     f"Expected more messages in queue '{queue_name}' but failed to retrieve."
@@ -324,6 +315,30 @@ class QueueAgent:
         )
         return messages_retrieved
 
+    def _release_delivery_tag(self, message):
+        """
+        Validate the delivery tag appended to the message before acking or rejecting it.
+
+        Returns:
+            The delivery tag if it can be acked or rejected on the current channel, None otherwise.
+        """
+        # Grab the delivery tag we appended to the message dict
+        delivery_tag = message.get("delivery_tag")
+        if not delivery_tag:
+            logger.error("Message does not contain a delivery_tag.")
+            return None
+
+        if not self.connection_manager.consumer.release(
+            delivery_tag, message.get("delivery_channel")
+        ):
+            # The broker requeues the unacked messages of a lost channel,
+            # and acking a stale tag would close the channel that replaced it
+            logger.warning(
+                f"Delivery tag '{delivery_tag}' is no longer valid, the message was requeued by the broker."
+            )
+            return None
+        return delivery_tag
+
     def acknowledge_message(self, message):
         """
         Acknowledge a message by its delivery tag.
@@ -334,30 +349,25 @@ class QueueAgent:
         Returns:
             True if the message was acknowledged successfully, False otherwise.
         """
-        try:
-            # Grab the delivery tag we appended to the message dict
-            delivery_tag = message.get("delivery_tag")
-            if not delivery_tag:
-                logger.error("Message does not contain a delivery_tag.")
-                return False
+        consumer = self.connection_manager.consumer
+        delivery_tag = self._release_delivery_tag(message)
+        if not delivery_tag:
+            return False
 
-            self.channel.basic_ack(delivery_tag)
+        try:
+            consumer.get_channel().basic_ack(delivery_tag)
             logger.debug(f"Acknowledged message with delivery tag '{delivery_tag}'.")
             return True
+        except ConnectionUnavailable as e:
+            logger.warning(
+                f"Cannot acknowledge message with delivery tag '{delivery_tag}': {e}"
+            )
         except Exception as e:
             logger.warning(
                 f"Error acknowledging message with delivery tag '{delivery_tag}': {e}"
             )
+            consumer.handle_failure(e)
 
-            # Try to reconnect and get message again
-            logger.warning(
-                "Connection is closed. Attempting to reconnect and try getting message again."
-            )
-            if self.connect():
-                logger.debug("Reconnected successfully.")
-                return self.acknowledge_message(message)
-            else:
-                logger.error("Reconnection attempt from acknowledge_message() failed.")
         return False
 
     def reject_message(self, message, requeue=True):
@@ -371,33 +381,27 @@ class QueueAgent:
         Returns:
             True if the message was rejected successfully, False otherwise.
         """
-        try:
-            # Grab the delivery tag we appended to the message dict
-            delivery_tag = message.get("delivery_tag")
-            if not delivery_tag:
-                logger.error("Message does not contain a delivery_tag.")
-                return False
+        consumer = self.connection_manager.consumer
+        delivery_tag = self._release_delivery_tag(message)
+        if not delivery_tag:
+            return False
 
+        try:
             # Reject the message
-            self.channel.basic_nack(delivery_tag, requeue=requeue)
+            consumer.get_channel().basic_nack(delivery_tag, requeue=requeue)
             logger.debug(
                 f"Rejected message with delivery tag '{delivery_tag}'. Requeue: {requeue}"
             )
             return True
-        except Exception as e:
+        except ConnectionUnavailable as e:
             logger.warning(
-                f"Error rejecting message with delivery tag '{delivery_tag}': {e}"
+                f"Cannot reject message with delivery tag '{delivery_tag}': {e}"
             )
-
-            # Try to reconnect and get message again
+        except Exception as e:
             logger.warning(
-                "Connection is closed. Attempting to reconnect and try getting message again."
+                f"Error rejecting message with delivery tag '{delivery_tag}': {e}"
             )
-            if self.connect():
-                logger.debug("Reconnected successfully.")
-                return self.reject_message(message, requeue=requeue)
-            else:
-                logger.error("Reconnection attempt from reject_message() failed.")
+            consumer.handle_failure(e)
 
         return False
 
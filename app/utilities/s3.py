@@ -39,3 +39,9 @@ def move_file(source_key, destination_key):
         delete_file(source_key)
     except Exception as e:
         logger.error(f"Error moving file: {e}", extra={"file_key": key})
+
+
+def put_object(key, body, content_type="application/gzip"):
+    s3.meta.client.put_object(
+        Bucket=S3_BUCKET_NAME, Key=key, Body=body, ContentType=content_type
+    )
@@ -0,0 +1,99 @@
+import json
+import os
+import random
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from app.config import TRACE_FILE, TRACE_SAMPLE_RATE
+from app.utilities.logging import logger
+
+
+class Tracer:
+    """
+    Per-message tracer exporting spans in the Chrome trace event format.
+
+    A trace covers the processing of one message. Its spans are buffered until the trace
+    ends, so that they all carry the job uid and the queue name even if these are only
+    known halfway through. The file can be opened with Perfetto or chrome://tracing.
+    """
+
+    def __init__(self, path=TRACE_FILE, sample_rate=TRACE_SAMPLE_RATE):
+        self.path = path
+        self.sample_rate = sample_rate
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.pid = os.getpid()
+
+    @property
+    def enabled(self):
+        return self.sample_rate > 0
+
+    def start_trace(self, **args):
+        """Start the trace of a message on this thread, if it is sampled."""
+        if not self.enabled or random.random() >= self.sample_rate:
+            self.local.trace = None
+            return
+        self.local.trace = {"args": args, "spans": [], "attempts": Counter()}
+
+    def annotate(self, **args):
+        """Add arguments to all spans of the current trace."""
+        trace = getattr(self.local, "trace", None)
+        if trace is not None:
+            trace["args"].update(args)
+
+    @contextmanager
+    def span(self, name, **args):
+        """
+        Time a stage of the current trace.
+
+        Repeated spans of the same name in a trace are numbered with an `attempt` arg.
+        """
+        trace = getattr(self.local, "trace", None)
+        if trace is None:
+            yield
+            return
+
+        trace["attempts"][name] += 1
+        args["attempt"] = trace["attempts"][name]
+        start = time.time()
+        try:
+            yield
+        finally:
+            trace["spans"].append(
+                {
+                    "name": name,
+                    "cat": "orchestrator",
+                    "ph": "X",
+                    "ts": start * 1e6,
+                    "dur": (time.time() - start) * 1e6,
+                    "pid": self.pid,
+                    "tid": threading.get_native_id(),
+                    "args": args,
+                }
+            )
+
+    def end_trace(self):
+        """End the trace of this thread and append its spans to the trace file."""
+        trace = getattr(self.local, "trace", None)
+        self.local.trace = None
+        if not trace or not trace["spans"]:
+            return
+
+        lines = []
+        for event in trace["spans"]:
+            event["args"] = {**trace["args"], **event["args"]}
+            lines.append(json.dumps(event, default=str) + ",\n")
+
+        try:
+            with self.lock, open(self.path, "a") as trace_file:
+                # The JSON array format of trace events allows omitting the closing bracket
+                if trace_file.tell() == 0:
+                    trace_file.write("[\n")
+                trace_file.writelines(lines)
+        except OSError as e:
+            logger.error(f"Error writing trace to {self.path}: {e}")
+
+
+tracer = Tracer()
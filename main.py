@@ -1,17 +1,53 @@
-import json
+import signal
+import sys
 import time
 
 from app.utilities.rabbitmq import QueueAgent
 from app.utilities.logging import logger
 from app.utilities.reporting import ping_uptime_monitor
-from app.config import ROWS_PER_ROUND, POLLING_INTERVAL, PAUSE
+from app.utilities.autoscaling import scaling_signal, start_scaling_server
+from app.utilities.profiling import profiler, install_profiler_signal
+from app.utilities.capture import recorder
+from app.config import (
+    POLLING_INTERVAL,
+    PAUSE,
+    AUTOSCALING_PORT,
+    PROGRESS_FLUSH_INTERVAL,
+    PROFILE_AT_START,
+)
 from app.process_email import EmailProcessor
+from app.orchestrator import process_round
 
 queue_agent = QueueAgent()
 email_processor = EmailProcessor()
 
+# Profile the process on SIGUSR1, and at start up if enabled
+install_profiler_signal()
+if PROFILE_AT_START:
+    profiler.start()
+
+# Exit through SystemExit on SIGTERM, so that the atexit handlers write the buffered
+# capture events and job progress before the process stops
+signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+# Serve the scaling signal for the horizontal autoscaler
+if AUTOSCALING_PORT:
+    start_scaling_server(AUTOSCALING_PORT)
+
+# Write the job progress to the database in bulk.
+# Imported only when enabled, the database module connects on import.
+progress_writer = None
+if PROGRESS_FLUSH_INTERVAL:
+    from app.utilities.progress import JobProgressWriter
+
+    progress_writer = JobProgressWriter()
+    progress_writer.start()
+
 
 while True:
+    # Write the capture events buffered since the last interval, also when idle
+    recorder.flush_due()
+
     # Pause if env variable is set to pause
     if PAUSE:
         logger.info(
@@ -26,47 +62,28 @@ while True:
     # Iterations start time
     start_time = time.time()
 
-    discovered_queues = queue_agent.list_all_queues()
+    queues_details = queue_agent.list_all_queues_details() or []
+    discovered_queues = [queue.get("name") for queue in queues_details]
+
+    # Record the arrival of new files for replays
+    recorder.record_queues(queues_details)
+
+    # Feed the discovery payloads of both vhosts to the scaling signal
+    if AUTOSCALING_PORT:
+        scaling_signal.observe(
+            queues_details,
+            email_processor.queue_agent.list_all_queues_details() or [],
+        )
+
     if len(discovered_queues) == 0:
+        # Complete the results of the jobs whose queues are gone
+        email_processor.finish_idle_results()
         logger.debug(f"No queues found. Sleeping for {POLLING_INTERVAL} seconds.")
         time.sleep(POLLING_INTERVAL)
         continue
     logger.debug(f"Discovered Queues: {discovered_queues}")
 
-    # Iterate through each discovered queue
-    for i, queue in enumerate(discovered_queues):
-        # Iterate as many times as the message-per-round setting
-        for _ in range(ROWS_PER_ROUND):
-            logger.debug(
-                f"Attempting to read {ROWS_PER_ROUND} messages from queue: {queue}"
-            )
-            message = queue_agent.get_message(queue_name=queue)
-            if message:
-                # Get the job uid from queue args,
-                # to be passed to QueueAgent.process_message method
-                # so that it is added to the results queue as an arg
-                job_uid = queue_agent.get_job_uid(queue_name=queue)
-
-                # If the processor was able to complete validation and publishing to the result queue
-                if email_processor.process_message(message, job_uid):
-                    queue_agent.acknowledge_message(message)
-                else:
-                    queue_agent.reject_message(message, requeue=True)
-
-                logger.debug(
-                    f"Row {message['rowNumber']}/{message['totalRows']} processed from queue {queue}: {json.dumps(message, indent=2)}"
-                )
-            else:
-                # No messages in the queue, delete it
-                queue_agent.delete_queue(queue)
-                logger.debug(
-                    f"Deleting validation queue {queue} because there is no message in it."
-                )
-
-            if i == len(discovered_queues) - 1:
-                logger.debug(
-                    f"Round of processing {ROWS_PER_ROUND} messages from all queues is complete."
-                )
+    process_round(queue_agent, email_processor, discovered_queues, progress_writer)
 
     # Iteration end time
     end_time = time.time()
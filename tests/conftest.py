@@ -0,0 +1,34 @@
+import logging
+import os
+
+# The app reads its settings on import, these stand in for the deployment's
+os.environ.update(
+    {
+        "S3_BUCKET_NAME": "results-bucket",
+        "POLLING_INTERVAL": "1",
+        "UPTIME_MONITOR": "http://localhost",
+        "DATABASE_CONNECTION_STRING": "sqlite://",
+        "RABBITMQ_HOST": "localhost",
+        "RABBITMQ_DEFAULT_VHOSTS": "files,emails",
+        "RABBITMQ_USERNAME": "test",
+        "RABBITMQ_PASSWORD": "test",
+        "LOKI_USER": "test",
+        "LOKI_PASSWORD": "test",
+        "LOKI_HOST": "http://localhost",
+        "SERVICE_NAME": "test",
+        "TIMEZONE": "UTC",
+        "S3_ENDPOINT": "https://s3.amazonaws.com",
+        "S3_KEY": "test",
+        "S3_SECRET": "test",
+        "VALIDATION_WORKERS": "http://worker-1,http://worker-2",
+        "VALIDATOR_API_KEY": "test",
+        "AWS_DEFAULT_REGION": "us-east-1",
+    }
+)
+
+from app.utilities.logging import logger  # noqa: E402
+
+# Keep the test logs on the console only
+logger.handlers = [
+    handler for handler in logger.handlers if type(handler) is logging.StreamHandler
+]
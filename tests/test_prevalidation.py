@@ -0,0 +1,53 @@
+import pytest
+
+from app.prevalidation import PreValidator
+
+
+@pytest.fixture
+def prevalidator(tmp_path):
+    disposable = tmp_path / "disposable.txt"
+    disposable.write_text("mailinator.com\n")
+    roles = tmp_path / "roles.txt"
+    roles.write_text("noreply\n")
+    return PreValidator(
+        disposable_file=str(disposable), blocked_file="", role_file=str(roles)
+    )
+
+
+@pytest.mark.parametrize(
+    "email, status",
+    [
+        ("user@example.com", None),
+        ("user@bücher.de", None),
+        ('"quoted user"@example.com', None),
+        ("user@[192.0.2.1]", None),
+        ("user@example", "invalid"),
+        ("user..name@example.com", "invalid"),
+        ("user@-example.com", "invalid"),
+        ("user@mail.mailinator.com", "disposable"),
+        ("noreply+tag@example.com", "role"),
+    ],
+)
+def test_check(prevalidator, email, status):
+    result = prevalidator.check(email)
+    assert (result and result["status"]) == status
+
+
+@pytest.mark.parametrize(
+    "email",
+    [
+        "user@example.com\n",
+        " user@example.com",
+        "user@example.com ",
+        "user@example.com\t",
+    ],
+)
+def test_surrounding_whitespace_is_left_to_the_workers(prevalidator, email):
+    assert prevalidator.check(email) is None
+
+
+@pytest.mark.parametrize(
+    "email", ["user@exa\nmple.com", "us\ner@example.com", "user@example.com\nx"]
+)
+def test_inner_newline_is_invalid(prevalidator, email):
+    assert prevalidator.check(email)["status"] == "invalid"
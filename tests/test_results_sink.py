@@ -0,0 +1,148 @@
+import gzip
+import json
+import time
+
+import boto3
+import pytest
+from moto import mock_aws
+
+import app.utilities.s3
+from app.config import S3_BUCKET_NAME
+from app.results_sink import S3ResultsSink
+
+
+@pytest.fixture
+def bucket(monkeypatch):
+    """A local S3 stand-in with the results bucket, used by `put_object`."""
+    with mock_aws():
+        s3 = boto3.resource("s3", region_name="us-east-1")
+        s3.create_bucket(Bucket=S3_BUCKET_NAME)
+        # The app's resource is created on import, before the stand-in is started
+        monkeypatch.setattr(app.utilities.s3, "s3", s3)
+        yield s3.Bucket(S3_BUCKET_NAME)
+
+
+class Publisher:
+    """Records the published markers, failing while `fail` is set."""
+
+    def __init__(self):
+        self.markers = []
+        self.fail = False
+
+    def __call__(self, message, job_uid, marker):
+        if self.fail:
+            return False
+        self.markers.append(marker)
+        return True
+
+
+def message(row, queue="job-1"):
+    return {"queueName": queue, "rowNumber": row, "email": f"user{row}@example.com"}
+
+
+def read_rows(bucket, key):
+    body = bucket.Object(key).get()["Body"].read()
+    return [json.loads(line) for line in gzip.decompress(body).splitlines()]
+
+
+def test_chunk_upload_acks_after_upload(bucket):
+    publisher = Publisher()
+    sink = S3ResultsSink(publisher, chunk_rows=3, chunk_seconds=60)
+    acks = []
+
+    def on_complete(message, job_uid, succeeded):
+        acks.append((message["rowNumber"], succeeded))
+
+    for row in (1, 2):
+        sink.add(message(row), "uid-1", {"status": "valid"}, on_complete)
+    assert acks == []
+    assert list(bucket.objects.all()) == []
+
+    sink.add(message(3), "uid-1", {"status": "invalid"}, on_complete)
+    assert acks == [(1, True), (2, True), (3, True)]
+
+    [key] = [obj.key for obj in bucket.objects.all()]
+    assert key.startswith("results/uid-1/")
+    assert read_rows(bucket, key) == [
+        {"status": "valid", "rowNumber": 1},
+        {"status": "valid", "rowNumber": 2},
+        {"status": "invalid", "rowNumber": 3},
+    ]
+    assert publisher.markers == [{"type": "progress", "key": key, "rows": 3}]
+
+
+def test_due_chunk_is_uploaded_when_idle(bucket):
+    sink = S3ResultsSink(Publisher(), chunk_rows=100, chunk_seconds=0.05)
+    acks = []
+    sink.add(message(1), "uid-1", {"status": "valid"}, lambda *args: acks.append(args))
+
+    sink.finish_idle()
+    assert acks == []
+
+    time.sleep(0.1)
+    sink.finish_idle()
+    assert [succeeded for _, _, succeeded in acks] == [True]
+    assert len(list(bucket.objects.all())) == 1
+
+
+def test_finish_retries_the_marker_until_published(bucket):
+    publisher = Publisher()
+    sink = S3ResultsSink(publisher, chunk_rows=2, chunk_seconds=60)
+    for row in (1, 2, 3):
+        sink.add(message(row), "uid-1", {"status": "valid"}, lambda *args: None)
+
+    publisher.fail = True
+    assert sink.finish("job-1") is False
+    # The job is kept, and takes no new results while completing
+    assert "job-1" in sink.jobs
+    acks = []
+    sink.add(message(4), "uid-1", {"status": "valid"}, lambda *args: acks.append(args))
+    assert [succeeded for _, _, succeeded in acks] == [False]
+
+    publisher.fail = False
+    assert sink.finish("job-1") is True
+    assert "job-1" not in sink.jobs
+
+    keys = sorted(obj.key for obj in bucket.objects.all())
+    assert publisher.markers[-1] == {
+        "type": "complete",
+        "bucket": S3_BUCKET_NAME,
+        "keys": keys,
+        "rows": 3,
+    }
+    rows = [row["rowNumber"] for key in keys for row in read_rows(bucket, key)]
+    assert rows == [1, 2, 3]
+
+
+def test_failed_upload_requeues_and_backs_off(bucket, monkeypatch):
+    uploads = []
+
+    def failing_put_object(key, body):
+        uploads.append(key)
+        raise ConnectionError("S3 is down")
+
+    monkeypatch.setattr("app.results_sink.put_object", failing_put_object)
+    sink = S3ResultsSink(Publisher(), chunk_rows=2, chunk_seconds=60)
+    acks = []
+
+    def on_complete(message, job_uid, succeeded):
+        acks.append((message["rowNumber"], succeeded))
+
+    for row in (1, 2, 3, 4):
+        sink.add(message(row), "uid-1", {"status": "valid"}, on_complete)
+
+    assert acks == [(1, False), (2, False), (3, False), (4, False)]
+    assert len(uploads) == 1
+    assert sink.accepting("job-1") is False
+    assert sink.accepting("job-2") is True
+
+
+def test_store_result_requeues_a_result_that_cannot_be_stored(bucket):
+    from app.process_email import EmailProcessor
+
+    processor = EmailProcessor(queue_agent=object(), results_sink="s3")
+    acks = []
+    processor.store_result(
+        message(1), "uid-1", "not a dict", lambda *args: acks.append(args)
+    )
+    assert [succeeded for _, _, succeeded in acks] == [False]